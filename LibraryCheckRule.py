@@ -1,14 +1,10 @@
 from rflint.common import GeneralRule, WARNING, ERROR, IGNORE
-from rflint.parser import SettingTable, TestcaseTable
-from rflint import RobotFactory, Keyword
-import platform
-from pathlib import PureWindowsPath, PurePosixPath
-import re
 import os
 import sys
 sys.path.append(os.path.dirname(__file__))
-from utility import project_meta
-import threading
+import utility
+from utility import KeywordIndex, get_project, normalize_name, similarity, signature_bands
+from instrumentation import instrument, phase
 
 
 def extract_max_same_path(files):
@@ -25,138 +21,30 @@ def extract_max_same_path(files):
     return ''.join(chars)
 
 
-def all_robot_files(path):
-    ret = []
-    if platform.system() == "Linux":
-        p = PurePosixPath(path)
-    else:
-        p = PureWindowsPath(path)
-    for root, _, files in os.walk(p.parents[0]):
-        for f in files:
-            if f.endswith('.txt') or f.endswith('.robot'):
-                ret.append(os.path.join(root, f))
-    return ret
-
-
-def is_root_folder(path):
-    try:
-        if not os.path.isdir(path):
-            return False
-        if '.project' in [f.encode('cp950').decode() for f in os.listdir(path)]:
-            return True
-    except:
-        if '.project' in [f.encode('utf-8').decode() for f in os.listdir(path)]:
-            return True
-
-
-def project_file(path):
-    return '%s/.project' % project_root(path)
-
-
-def project_root(path):
-    if is_root_folder(path):
-        return path
-    if platform.system() == "Linux":
-        return project_root(PurePosixPath(path).parent)
-    else:
-        return project_root(PureWindowsPath(path).parent)
-
-
-def get_project_folder_files_def_keywords_map(path):
-    if platform.system() == "Linux":
-        return get_subfolder_files_def_keywords_map(project_file(PurePosixPath(path).parent))
-    else:
-        return get_subfolder_files_def_keywords_map(project_file(PureWindowsPath(path).parent))
-
-
-def get_subfolder_files_def_keywords_map(path):
-    files = all_robot_files(path)
-    file_keywords = dict()
-    for f in files:
-        file_keywords.setdefault(f, keywords(f))
-    return file_keywords
-
-
-def normalize_name(string):
-    return string.replace(" ", "").replace("_", "").lower()
-
-
-def keywords(file):
-    rbfile = RobotFactory(file)
-    ret = []
-    for keyword in rbfile.walk(Keyword):
-        ret.append(keyword)
-    return ret
-
-
-def same(keyword_def, keyword_use):
-    """
-    >>> same('Get Position', 'Get Position 1')
-    False
-    >>> same('Get Position', 'Get Position')
-    True
-    >>> same('Use Variable ${var1}', 'Use Variable 123')
-    True
-    >>> same('Use Variable 123', 'Use Variable ${var1}')
-    True
-    >>> same('Use Variable ${var1}', 'Use Variable ${var2}')
-    True
-    >>> same('Use Variable ${var1} hi', 'Use Variable 132')
-    False
-    >>> same('The Column ${customField} Was Set To Be Visible', 'The Column ${customField.fieldName} Was Set To Be Visible')
-    True
-    >>> same('The Column ${customField.fieldName} Was Set To Be Visible', 'The Column ${customField} Was Set To Be Visible')
-    True
-    >>> same('Action', '"*+,-./:;<="()')
-    False
-    >>> same('Action', '(')
-    False
-    >>> same('.', '.')
-    True
-    >>> same('Action', None)
-    False
-    """
-    try:
-        if keyword_def != keyword_use and (keyword_def == None or keyword_use == None):
-            return False
-        ndef = normalize_name(keyword_def)
-        nuse = normalize_name(keyword_use)
-        if ('{' in ndef and '}' in ndef) or ('{' in nuse and '}' in nuse):
-            return re.match("^%s$" % re.sub(r'\\?[@$&]\\{[^\}]+\\}', r'.+', re.escape(ndef)), nuse) != None or re.match("^%s$" % re.sub(r'\\?[@$&]\\{[^\}]+\\}', r'.+', re.escape(nuse)), ndef) != None
-        return ndef == nuse
-    except:
-        raise Exception((keyword_def, keyword_use))
-
-
-metas = None
-def get_metas(path):
-    global metas
-    if metas == None:
-        metas = project_meta(path)
-    return metas
-
-
 class MoveKeyword(GeneralRule):
 
     severity = IGNORE
 
     def apply(self, rf_file):
-        metas = get_metas(rf_file.path)
-        current = next(filter(lambda x: x.source == rf_file.path, metas))
-        for keyword, values in current.defs.items():
-            used_metas = [meta for meta in metas if any([same(keyword, k) for k in meta.uses.keys()])]
-            self_usage = any(same(keyword, used) for used in current.uses.keys())
+        project = get_project(rf_file)
+        current = project.meta_of(rf_file.path)
+        if current == None:
+            # left out of the project by RFLINT_INCLUDE or RFLINT_EXCLUDE
+            return
+        for keyword, line in current.defs.items():
+            used_metas = project.callers_of(keyword)
+            self_usage = current in used_metas
 
             # Move the keyword to a file
             if len(used_metas) == 1 and not self_usage:
-                self.report(rf_file, 'Move the keyword to file `%s`' % (os.path.relpath(used_metas[0].source, os.path.dirname(rf_file.path))), values['line'])
+                self.report(rf_file, 'Move the keyword to file `%s`' % (os.path.relpath(used_metas[0].source, os.path.dirname(rf_file.path))), line)
 
             # Move the keyword to a folder
             common_path = extract_max_same_path([meta.source for meta in used_metas])
             if len(used_metas) > 1 and os.path.normpath(common_path) != os.path.normpath(os.path.dirname(rf_file.path)) and os.path.isdir(common_path) and not self_usage:
                 move = os.path.relpath(common_path, os.path.dirname(rf_file.path))
                 if '..' not in move:
-                    self.report(rf_file, 'Move the keyword to folder `%s\\keywords.txt`' % move, values['line'])
+                    self.report(rf_file, 'Move the keyword to folder `%s\\keywords.txt`' % move, line)
 
 
 class UnusedKeyword(GeneralRule):
@@ -165,6 +53,8 @@ class UnusedKeyword(GeneralRule):
 
     def __init__(self, controller, severity=None):
         super().__init__(controller, severity=severity)
+        self.project = None
+        self.generation = None
         self.rfMetas = None
         self.file_with_keywords = None
         self.all_keywords = []
@@ -176,51 +66,35 @@ class UnusedKeyword(GeneralRule):
                 self.all_keywords.append(keyword)
 
     def create_unused_keywords_list(self):
-        def find_used_keywords():
-            self.used_keywords = []
-            for meta in self.rfMetas:
-                for key in meta.uses.keys():
-                    self.used_keywords.append(key)
-            self.used_keywords = [keyword for keyword in self.used_keywords if not '=' in keyword]
-            self.used_keywords = list(dict.fromkeys(self.used_keywords))
-        
-        def find_unused_keywords_by_simple_compare():
-            self.unused_keywords = []
-            for keyword in self.all_keywords:
-                if not(keyword.name in self.used_keywords):
-                    self.unused_keywords.append(keyword.name)
-
-        def find_unused_keywords_by_regular_compare():
-            compared_keywords = self.unused_keywords.copy()
-            self.unused_keywords = []
-            for keyword in compared_keywords:
-                for key in self.used_keywords:
-                    if not same(keyword, key):
-                        self.unused_keywords.append(keyword)
-                        break
-
-        find_used_keywords()
-        find_unused_keywords_by_simple_compare()
-        find_unused_keywords_by_regular_compare()
+        used_keywords = KeywordIndex(keyword for meta in self.rfMetas for keyword in meta.uses if not '=' in keyword)
+        self.unused_keywords = set(keyword.name for keyword in self.all_keywords if not used_keywords.lookup(keyword.name))
 
     def apply(self, rf_file):
-        if self.rfMetas == None:
-            self.rfMetas = get_metas(rf_file.path)
-            self.file_with_keywords = get_project_folder_files_def_keywords_map(rf_file.path)
+        project = get_project(rf_file)
+        if self.project != project or self.generation != project.generation:
+            self.project = project
+            self.generation = project.generation
+            self.rfMetas = project.metas
+            self.file_with_keywords = project.keywords
+            self.all_keywords = []
             self.append_to_all_keywords_list()
-            self.create_unused_keywords_list()
-            
-        current = next(filter(lambda meta: meta.source == rf_file.path, self.rfMetas))
-        for keyword, values in current.defs.items():
+            with phase('unused keyword detection'):
+                self.create_unused_keywords_list()
+
+        current = project.meta_of(rf_file.path)
+        if current == None:
+            return
+        for keyword, line in current.defs.items():
             if current.is_test_data:
                 if self.not_used(keyword, [current]):
-                    self.report(rf_file, 'Unused Keyword', values['line'])
+                    self.report(rf_file, 'Unused Keyword', line)
             elif keyword in self.unused_keywords:
-                self.report(rf_file, 'Unused Keyword', values['line'])
-    
+                self.report(rf_file, 'Unused Keyword', line)
+
     def not_used(self, keyword, metas):
+        used = self.project.use_index.lookup(keyword)
         for meta in metas:
-            if any(same(keyword, used) for used in meta.uses.keys()):
+            if any(name in meta.uses for name in used):
                 return False
         return True
 
@@ -230,154 +104,166 @@ class DuplicatedKeyword(GeneralRule):
 
     def __init__(self, controller, severity=None):
         super().__init__(controller, severity=severity)
+        self.project = None
+        self.generation = None
         self.file_with_keywords = None
         self.all_keywords = []
-    
-    def append_to_all_keywords_list(self):
+        self.duplicate_names = dict()
+        self.duplicate_implements = dict()
+        self.similarity = None
+        self.similar_implements = dict()
 
-        def remove_blank_line(keyword):
-            keyword.rows = [row for row in keyword.rows if row.raw_text != '']
+    def configure(self, similarity):
+        """Also report implementations at least `similarity` (0 to 1) alike."""
+        self.similarity = float(similarity)
 
+    def append_to_all_keywords_list(self):
         for file, keywords in self.file_with_keywords.items():
             for keyword in keywords:
-                remove_blank_line(keyword)
                 self.all_keywords.append(keyword)
 
-    def compare_with_same_implement_length(self, keywords, line_count):
+    def group_by_implementation(self):
 
         def set_duplicate_keyword_implement_message(duplicate_keywords):
             for keyword in duplicate_keywords:
-                setattr(keyword, 'duplicate_implement', [other_keyword for other_keyword in duplicate_keywords if (other_keyword != keyword and other_keyword.parent.path != keyword.parent.path)])
-
-        def separe_and_compare_line_by_line(to_be_compare_keywords, line_index):
-
-            def lookahead(iterable):
-                it = iter(iterable)
-                last = next(it)
-                for val in it:
-                    yield last, False
-                    last = val
-                yield last, True
-            
-            def compare_or_set_message(keywords):
-                if len(keywords) > 1:
-                    if line_index + 1 == line_count:
-                        set_duplicate_keyword_implement_message(keywords)
-                    else:
-                        separe_and_compare_line_by_line(keywords, line_index + 1)
-
-            compare_list = []
-
-            for keyword, is_last in lookahead(to_be_compare_keywords):
-                if len(compare_list) == 0:
-                    compare_list.append(keyword)
-                elif keyword.rows[line_index].raw_text == compare_list[0].rows[line_index].raw_text:
-                    compare_list.append(keyword)
-                else:
-                    compare_or_set_message(compare_list)
-                    compare_list = [keyword]
-                if is_last:
-                    compare_or_set_message(compare_list)
-        
-        separe_and_compare_line_by_line(keywords, 0)
-
-    def compare_with_same_keyword_name_length(self, keywords):
+                self.duplicate_implements[keyword] = [other_keyword for other_keyword in duplicate_keywords if (other_keyword != keyword and other_keyword.path != keyword.path)]
+
+        implementations = dict()
+        for keyword in self.all_keywords:
+            if len(keyword.rows) > 0:
+                implementations.setdefault(tuple(keyword.rows), []).append(keyword)
+        for keywords in implementations.values():
+            if len(keywords) > 1:
+                set_duplicate_keyword_implement_message(keywords)
+
+    def group_by_similarity(self):
+        buckets = dict()
+        for keyword in self.all_keywords:
+            if keyword.signature != None:
+                for band in signature_bands(keyword.signature):
+                    buckets.setdefault(band, []).append(keyword)
+
+        order = {keyword: i for i, keyword in enumerate(self.all_keywords)}
+        compared = set()
+        for keywords in buckets.values():
+            for i, keyword in enumerate(keywords):
+                for other_keyword in keywords[i+1:]:
+                    if (keyword, other_keyword) in compared or other_keyword.path == keyword.path or other_keyword.rows == keyword.rows:
+                        continue
+                    compared.add((keyword, other_keyword))
+                    score = similarity(keyword.signature, other_keyword.signature)
+                    if score >= self.similarity:
+                        self.similar_implements.setdefault(keyword, []).append((other_keyword, score))
+                        self.similar_implements.setdefault(other_keyword, []).append((keyword, score))
+        for similar in self.similar_implements.values():
+            similar.sort(key=lambda x: order[x[0]])
+
+    def group_by_name(self):
 
         def set_duplicate_keyword_name_message(duplicate_keywords):
             for keyword in duplicate_keywords:
-                setattr(keyword, 'duplicate_name', [other_keyword for other_keyword in duplicate_keywords if (other_keyword != keyword and other_keyword.parent.path != keyword.parent.path)])
-
-        compare_list = []
-        current_duplicate_name = ''
+                self.duplicate_names[keyword] = [other_keyword for other_keyword in duplicate_keywords if (other_keyword != keyword and other_keyword.path != keyword.path)]
 
-        keywords = iter(keywords)
-        while True:
-            try:
-                current_keyword = next(keywords)
-                if current_keyword.name == current_duplicate_name:
-                    compare_list.append(current_keyword)
-                else:
-                    if len(compare_list) > 1:
-                        set_duplicate_keyword_name_message(compare_list)
-                    compare_list = [current_keyword]
-                    current_duplicate_name = current_keyword.name
-            except StopIteration:
-                if len(compare_list) > 1:
-                    set_duplicate_keyword_name_message(compare_list)
-                break
-
-    def sorted_by_name_and_compare(self):
-        all_keywords = sorted(self.all_keywords, key=lambda x:len(x.name))
-
-        min_keywordNameLen = len(all_keywords[0].name)
-        max_keywordNameLen = len(all_keywords[-1].name)
-
-        threads = []
-        for length in range(min_keywordNameLen, max_keywordNameLen+1):
-            same_name_length_keywords = list(filter(lambda keyword: len(keyword.name)==length, all_keywords))
-            if len(same_name_length_keywords) <= 1:
-                continue
-            same_name_length_keywords = sorted(same_name_length_keywords, key=lambda x:x.name)
-            threads.append(threading.Thread(target=self.compare_with_same_keyword_name_length, args=(same_name_length_keywords,)))
-            threads[len(threads)-1].start()
-        
-        for index in range(len(threads)):
-            threads[index].join()
-
-    def sorted_by_impl_length_and_compare(self):
-        all_keywords = sorted(self.all_keywords, key=lambda x:len(x.rows))
-
-        min_keywordImplLen = len(all_keywords[0].rows)
-        max_keywordImplLen = len(all_keywords[-1].rows)
-
-        threads = []
-        for length in range(min_keywordImplLen, max_keywordImplLen+1):
-            same_implement_length_keywords = list(filter(lambda x:len(x.rows)==length, all_keywords))
-            if len(same_implement_length_keywords) <= 1:
-                continue
-            same_implement_length_keywords = sorted(same_implement_length_keywords, key=lambda x:[row.raw_text for row in x.rows])
-            threads.append(threading.Thread(target=self.compare_with_same_implement_length, args=(same_implement_length_keywords, length,)))
-            threads[len(threads)-1].start()
-        
-        for index in range(len(threads)):
-            threads[index].join()
+        names = dict()
+        for keyword in self.all_keywords:
+            names.setdefault(normalize_name(keyword.name), []).append(keyword)
+        for keywords in names.values():
+            if len(keywords) > 1:
+                set_duplicate_keyword_name_message(keywords)
 
     def apply(self, rbfile):
 
-        if self.file_with_keywords is None:
+        project = get_project(rbfile)
+        if self.project != project or self.generation != project.generation:
 
-            self.file_with_keywords = get_project_folder_files_def_keywords_map(rbfile.path)
+            self.project = project
+            self.generation = project.generation
+            self.file_with_keywords = project.keywords
+            self.all_keywords = []
+            self.duplicate_names = dict()
+            self.duplicate_implements = dict()
+            self.similar_implements = dict()
             self.append_to_all_keywords_list()
-            
-            threads = []
-            threads.append(threading.Thread(target=self.sorted_by_name_and_compare))
-            threads.append(threading.Thread(target=self.sorted_by_impl_length_and_compare))
-
-            threads[0].start()
-            threads[1].start()
-
-            for index in range(len(threads)):
-                threads[index].join()
-
-        for keyword in self.file_with_keywords[rbfile.path]:
-            if hasattr(keyword, 'duplicate_implement'):
-                if hasattr(keyword, 'duplicate_name'):
-                    for duplicate_keyword in keyword.duplicate_implement:
-                        if duplicate_keyword in keyword.duplicate_name:
-                            self.report(keyword, 'Duplicated Keyword (name and impl): %s:%d' % (os.path.relpath(duplicate_keyword.parent.path, os.path.dirname(rbfile.path)), duplicate_keyword.linenumber), keyword.linenumber)
+
+            with phase('duplicate detection'):
+                self.group_by_name()
+                self.group_by_implementation()
+                if self.similarity != None:
+                    self.group_by_similarity()
+
+        for keyword in self.file_with_keywords.get(rbfile.path, []):
+            if keyword in self.duplicate_implements:
+                if keyword in self.duplicate_names:
+                    for duplicate_keyword in self.duplicate_implements[keyword]:
+                        if duplicate_keyword in self.duplicate_names[keyword]:
+                            self.report(keyword, 'Duplicated Keyword (name and impl): %s:%d' % (os.path.relpath(duplicate_keyword.path, os.path.dirname(rbfile.path)), duplicate_keyword.linenumber), keyword.linenumber)
                         else:
-                            self.report(keyword, 'Duplicated Keyword (impl): %s:%d [%s]' % (os.path.relpath(duplicate_keyword.parent.path, os.path.dirname(rbfile.path)), duplicate_keyword.linenumber, duplicate_keyword.name), keyword.linenumber)
-                    for duplicate_keyword in keyword.duplicate_name:
-                        if duplicate_keyword not in keyword.duplicate_implement:
-                            self.report(keyword, 'Duplicated Keyword (name): %s:%d' % (os.path.relpath(duplicate_keyword.parent.path, os.path.dirname(rbfile.path)), duplicate_keyword.linenumber), keyword.linenumber)
+                            self.report(keyword, 'Duplicated Keyword (impl): %s:%d [%s]' % (os.path.relpath(duplicate_keyword.path, os.path.dirname(rbfile.path)), duplicate_keyword.linenumber, duplicate_keyword.name), keyword.linenumber)
+                    for duplicate_keyword in self.duplicate_names[keyword]:
+                        if duplicate_keyword not in self.duplicate_implements[keyword]:
+                            self.report(keyword, 'Duplicated Keyword (name): %s:%d' % (os.path.relpath(duplicate_keyword.path, os.path.dirname(rbfile.path)), duplicate_keyword.linenumber), keyword.linenumber)
                 else:
-                    for duplicate_keyword in keyword.duplicate_implement:
-                        self.report(keyword, 'Duplicated Keyword (impl): %s:%d [%s]' % (os.path.relpath(duplicate_keyword.parent.path, os.path.dirname(rbfile.path)), duplicate_keyword.linenumber, duplicate_keyword.name), keyword.linenumber)
-            elif hasattr(keyword, 'duplicate_name'):
-                for duplicate_keyword in keyword.duplicate_name:
-                    self.report(keyword, 'Duplicated Keyword (name): %s:%d' % (os.path.relpath(duplicate_keyword.parent.path, os.path.dirname(rbfile.path)), duplicate_keyword.linenumber), keyword.linenumber)
+                    for duplicate_keyword in self.duplicate_implements[keyword]:
+                        self.report(keyword, 'Duplicated Keyword (impl): %s:%d [%s]' % (os.path.relpath(duplicate_keyword.path, os.path.dirname(rbfile.path)), duplicate_keyword.linenumber, duplicate_keyword.name), keyword.linenumber)
+            elif keyword in self.duplicate_names:
+                for duplicate_keyword in self.duplicate_names[keyword]:
+                    self.report(keyword, 'Duplicated Keyword (name): %s:%d' % (os.path.relpath(duplicate_keyword.path, os.path.dirname(rbfile.path)), duplicate_keyword.linenumber), keyword.linenumber)
+            for similar_keyword, score in self.similar_implements.get(keyword, []):
+                self.report(keyword, 'Similar Keyword (%d%%): %s:%d [%s]' % (score * 100, os.path.relpath(similar_keyword.path, os.path.dirname(rbfile.path)), similar_keyword.linenumber, similar_keyword.name), keyword.linenumber)
+
+
+PROJECT_RULES = (MoveKeyword, UnusedKeyword, DuplicatedKeyword)
+
+
+class ProjectFile:
+    """A project file as the library rules see it: they only need its path."""
+
+    def __init__(self, path):
+        self.path = path
+
+
+class ReportCollector:
+    """Controller keeping the reports of the library rules, grouped by file."""
+
+    def __init__(self):
+        self.files = dict()
+
+    def report(self, linenumber, filename, severity, message, rulename, char):
+        self.files.setdefault(filename, []).append((linenumber, char, severity, message, rulename))
+
+
+def lint_project(project, rules=None):
+    """
+    Run the library rules once over every file of `project`, without parsing any of them.
+
+    `rules` are configured instances of PROJECT_RULES, one of each at its
+    default severity when omitted. Returns (path, reports) pairs sorted by
+    path, each report being (linenumber, char, severity, message, rulename)
+    sorted by line, rule and message, so the result does not depend on the
+    order the files were found or visited in.
+    """
+    collector = ReportCollector()
+    if rules == None:
+        rules = [rule(collector) for rule in PROJECT_RULES]
+    rules = [rule for rule in rules if rule.severity != IGNORE]
+    rank = {rule.__name__: i for i, rule in enumerate(PROJECT_RULES)}
+    controllers = [rule.controller for rule in rules]
+    utility.projects.add(project)
+    try:
+        for rule in rules:
+            rule.controller = collector
+        for path in sorted(meta.source for meta in project.metas):
+            for rule in rules:
+                rule.apply(ProjectFile(path))
+    finally:
+        for rule, controller in zip(rules, controllers):
+            rule.controller = controller
+    return [(path, sorted(reports, key=lambda report: (report[0], report[1], rank[report[4]], report[3])))
+            for path, reports in sorted(collector.files.items())]
+
 
+instrument(globals())
 
 if __name__ == "__main__":
     import doctest
-    doctest.testmod()
+    doctest.testmod()
\ No newline at end of file
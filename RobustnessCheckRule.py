@@ -1,164 +1,176 @@
 from rflint.common import SuiteRule, KeywordRule, WARNING, ERROR
 from rflint.parser import SettingTable, TestcaseTable
 import re
+import os
+import functools
+import sys
+sys.path.append(os.path.dirname(__file__))
+from utility import nested_calls, suite_facts
+from instrumentation import instrument
+
+
+ACTIONS_ON_ELEMENT = frozenset([
+    'assign id to element',
+    'choose file',
+    'clear element text',
+    'click button',
+    'click element',
+    'click element at coordinates',
+    'click image',
+    'click link',
+    'double click element',
+    'drag and drop',
+    'drag and drop by offset',
+    'focus',
+    'get element attribute',
+    'get element count',
+    'get element size',
+    'get horizontal position',
+    'get list items',
+    'get selected list label',
+    'get selected list labels',
+    'get selected list value',
+    'get selected list values',
+    'get table cell',
+    'get text',
+    'get value',
+    'get vertical position',
+    'get webelement',
+    'get webelements',
+    'input password',
+    'input text',
+    'mouse down',
+    'mouse down on image',
+    'mouse down on link',
+    'mouse out',
+    'mouse over',
+    'mouse up',
+    'open context menu',
+    'press key',
+    'select all from list',
+    'select checkbox',
+    'select frame',
+    'select from list',
+    'select from list by index',
+    'select from list by label',
+    'select from list by value',
+    'set focus to element',
+    'simulate',  # Deprecated
+    'simulate event',
+    'unselect all from list',
+    'unselect checkbox',
+    'unselect from list',
+    'unselect from list by index',
+    'unselect from list by label'
+])
+
+WAIT_UNTIL_KEYWORDS = frozenset([
+    'wait for condition',
+    'wait until element contains',
+    'wait until element does not contain',
+    'wait until element is enabled',
+    'wait until element is not visible',
+    'wait until element is visible',
+    'wait until page contains',
+    'wait until page contains element',
+    'wait until page does not contain',
+    'wait until page does not contain element'
+])
+
+CLASS_EQUALS = re.compile('@class=.*')
+TEXT_EQUALS = re.compile('text()\\s*=')
 
 
 def extract_checked_keyword_calls(statement):
-    if len(statement) <= 1:
-        return []
-
-    keyword = statement[1]
-    if keyword.lower() != 'if':
-        return [(keyword, list(statement[2:]))]
-
-    # Inline IF: IF <cond> <keyword> [args] [ELSE IF <cond> <keyword> [args]] [ELSE <keyword> [args]]
+    """
+    >>> extract_checked_keyword_calls(['', 'Sleep', '1s'])
+    [('Sleep', ['1s'])]
+    >>> extract_checked_keyword_calls(['', 'IF', '${cond}', 'Sleep', '1s', 'ELSE IF', '${cond2}', 'Click Element', 'id=ok', 'ELSE', 'Unselect Frame', 'END'])
+    [('Sleep', ['1s']), ('Click Element', ['id=ok']), ('Unselect Frame', [])]
+    >>> extract_checked_keyword_calls(['', 'Run Keyword And Ignore Error', 'Sleep', '1s'])
+    [('Sleep', ['1s'])]
+    >>> extract_checked_keyword_calls(['', 'Run Keywords', 'Unselect Frame', 'AND', 'Sleep', '1s'])
+    [('Unselect Frame', []), ('Sleep', ['1s'])]
+    """
     calls = []
-    i = 3
-    while i < len(statement):
-        token = statement[i]
-        lower = token.lower()
-
-        if lower == 'else if':
-            i += 2
+    ranges = [(1, len(statement))]
+    while ranges:
+        start, end = ranges.pop()
+        if start >= end:
             continue
-        if lower == 'else':
-            i += 1
-            continue
-        if lower == 'end':
-            break
+        nested = nested_calls(statement, start, end)
+        if nested == None:
+            calls.append((statement[start], list(statement[start + 1:end])))
+        else:
+            ranges.extend(reversed(nested))
+    return calls
 
-        j = i + 1
-        while j < len(statement) and statement[j].lower() not in ['else if', 'else', 'end']:
-            j += 1
+class CheckedStatement:
+    """
+    A statement classified once for all the robustness checks. Only the
+    keyword calls are extracted up front; whether it acts on an element or
+    waits is worked out on first use, by check_missing_waiting.
+    """
 
-        calls.append((token, list(statement[i + 1:j])))
-        i = j
+    def __init__(self, statement):
+        self.tokens = statement
+        self.startline = statement.startline
+        self.calls = extract_checked_keyword_calls(statement)
 
-    return calls
+    @functools.cached_property
+    def lowered(self):
+        return [token.lower() for token in self.tokens]
+
+    @functools.cached_property
+    def acts_on_element(self):
+        return not ACTIONS_ON_ELEMENT.isdisjoint(self.lowered)
+
+    @functools.cached_property
+    def waits(self):
+        return not WAIT_UNTIL_KEYWORDS.isdisjoint(self.lowered)
 
 def check(self, obj, statement):
-    for keyword, args in extract_checked_keyword_calls(statement):
-        if keyword.lower() == 'unselect frame':
+    for keyword, args in statement.calls:
+        lower = keyword.lower()
+        if lower == 'unselect frame':
             self.report(obj, '`Unselect Frame` -> `[Teardown]    Unselect Frame`', statement.startline)
-        elif is_wait_until_keyword([keyword]):
-            if not any([token.startswith('timeout') for token in args]):
+        elif lower in WAIT_UNTIL_KEYWORDS:
+            if not any(token.startswith('timeout') for token in args):
                 self.report(obj, 'Missing timeout argument?', statement.startline)
-            if not any([token.startswith('error') for token in args]):
+            if not any(token.startswith('error') for token in args):
                 self.report(obj, 'Missing error argument?', statement.startline)
-        elif keyword.lower() == 'sleep' and (len(args) == 0 or "reason=" not in args[-1]):
+        elif lower == 'sleep' and (len(args) == 0 or "reason=" not in args[-1]):
             self.report(obj, 'DO NOT USE SLEEP!', statement.startline)
 
-        xpath = [arg for arg in args if arg.startswith('xpath')]
-        if len(xpath) > 0:
-            if re.search('@class=.*', xpath[0]):
+        xpath = next((arg for arg in args if arg.startswith('xpath')), None)
+        if xpath != None:
+            if CLASS_EQUALS.search(xpath):
                 self.report(obj, 'use contains(@class, ...)', statement.startline)
-            if re.search('text()\\s*=', xpath[0]):
+            if TEXT_EQUALS.search(xpath):
                 self.report(obj, 'use normalize-space(text())=', statement.startline)
 
 def check_missing_waiting(self, obj, name, statements):
-    previous = ['']
+    previous = None
     for statement in statements:
-        if is_action_on_element(statement):
-            if not is_wait_until_keyword(previous):
+        if statement.acts_on_element:
+            if previous == None or not previous.waits:
                 self.report(obj, 'Use keyword `ooo After It Is Visible` instead.', statement.startline)
             elif not name.lower().endswith('after it is visible'):
                 self.report(obj, 'Use keyword `ooo After It Is Visible` instead.', statement.startline)
         previous = statement
 
-def is_template(suite):
-    for table in suite.tables:
-        if isinstance(table, SettingTable):
-            if any([row[0].lower() == 'test template' for row in table.rows]):
-                return True
-    return False
-
-def is_action_on_element(statement):
-    for token in statement:
-        if token.lower() in [
-            'assign id to element',
-            'choose file',
-            'clear element text',
-            'click button',
-            'click element',
-            'click element at coordinates',
-            'click image',
-            'click link',
-            'double click element',
-            'drag and drop',
-            'drag and drop by offset',
-            'focus',
-            'get element attribute',
-            'get element count',
-            'get element size',
-            'get horizontal position',
-            'get list items',
-            'get selected list label',
-            'get selected list labels',
-            'get selected list value',
-            'get selected list values',
-            'get table cell',
-            'get text',
-            'get value',
-            'get vertical position',
-            'get webelement',
-            'get webelements',
-            'input password',
-            'input text',
-            'mouse down',
-            'mouse down on image',
-            'mouse down on link',
-            'mouse out',
-            'mouse over',
-            'mouse up',
-            'open context menu',
-            'press key',
-            'select all from list',
-            'select checkbox',
-            'select frame',
-            'select from list',
-            'select from list by index',
-            'select from list by label',
-            'select from list by value',
-            'set focus to element',
-            'simulate',  # Deprecated
-            'simulate event',
-            'unselect all from list',
-            'unselect checkbox',
-            'unselect from list',
-            'unselect from list by index',
-            'unselect from list by label'
-        ]:
-            return True
-    return False
-
-def is_wait_until_keyword(statement):
-    for token in statement:
-        if token.lower() in [
-            'wait for condition',
-            'wait until element contains',
-            'wait until element does not contain',
-            'wait until element is enabled',
-            'wait until element is not visible',
-            'wait until element is visible',
-            'wait until page contains',
-            'wait until page contains element',
-            'wait until page does not contain',
-            'wait until page does not contain element'
-        ]:
-            return True
-    return False
-
 class RobustnessCheck_Test(SuiteRule):
 
     severity = WARNING
 
     def apply(self, suite):
-        if not is_template(suite):
+        if not suite_facts(suite).test_template:
             for table in suite.tables:
                 if isinstance(table, TestcaseTable):
                     for testcase in table.testcases:
-                        # check_missing_waiting(self, testcase, '', testcase.statements)
-                        for statement in testcase.statements:
+                        statements = [CheckedStatement(statement) for statement in testcase.statements]
+                        # check_missing_waiting(self, testcase, '', statements)
+                        for statement in statements:
                             check(self, testcase, statement)
 
 class RobustnessCheck_Keyword(KeywordRule):
@@ -166,6 +178,9 @@ class RobustnessCheck_Keyword(KeywordRule):
     severity = WARNING
 
     def apply(self, keyword):
-        # check_missing_waiting(self, keyword, keyword.name, keyword.statements)
-        for statement in keyword.statements:
+        statements = [CheckedStatement(statement) for statement in keyword.statements]
+        # check_missing_waiting(self, keyword, keyword.name, statements)
+        for statement in statements:
             check(self, keyword, statement)
+
+instrument(globals())
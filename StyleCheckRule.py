@@ -1,6 +1,11 @@
-from rflint.common import SuiteRule, KeywordRule, GeneralRule, WARNING, ERROR
+from rflint.common import SuiteRule, KeywordRule, GeneralRule, WARNING, ERROR, IGNORE
 from rflint.parser import SettingTable, TestcaseTable, VariableTable, Testcase, Keyword, Row, Statement
 import re
+import os
+import sys
+sys.path.append(os.path.dirname(__file__))
+from utility import suite_facts
+from instrumentation import instrument
 
 def extract_name(statement):
     """
@@ -65,29 +70,14 @@ def last_variable(statement):
         else:
             return variable
 
-def is_test_template(suite):
-    for table in suite.tables:
-        if isinstance(table, SettingTable):
-            if any([row[0].lower() == 'test template' for row in table.rows]):
-                return True
-    return False
-
-def is_template(testcase):
-    if any([statement[1].lower() == '[template]' for statement in testcase.statements if not (len(statement) == 1 and statement[0] == '')]):
-        return True
-    return False
-
 class UseLogoff(SuiteRule):
 
     severity = WARNING
 
     def apply(self, suite):
-        for table in suite.tables:
-            if isinstance(table, SettingTable):
-                for row in table.rows:
-                    if row[0].lower().endswith('teardown'):
-                        if row[1].lower() == 'close browser':
-                            self.report(suite, 'Use keyword `Logoff` instead.', row.linenumber)
+        for row in suite_facts(suite).teardowns:
+            if row[1].lower() == 'close browser':
+                self.report(suite, 'Use keyword `Logoff` instead.', row.linenumber)
 
 class AssignmentStyle(GeneralRule):
 
@@ -108,9 +98,10 @@ class AssignmentStyle(GeneralRule):
                 self.report(obj, 'Add a space between the variable and `=`', linenumber)
 
     def apply(self, robotfile):
+        facts = suite_facts(robotfile)
         for table in robotfile.tables:
             if isinstance(table, TestcaseTable):
-                if not is_test_template(robotfile):
+                if not facts.test_template:
                     for testcase in table.testcases:
                         for statement in testcase.statements:
                             self.report_if_should_format_variable(robotfile, statement)
@@ -134,11 +125,12 @@ class UseCamelCaseKeyword(GeneralRule):
             self.report(obj, 'Keyword name is not Camel Case.', linenumber)
 
     def apply(self, robotfile):
+        facts = suite_facts(robotfile)
         for table in robotfile.tables:
-            if not is_test_template(robotfile):
+            if not facts.test_template:
                 if isinstance(table, TestcaseTable):
                     for testcase in table.testcases:
-                        if not is_template(testcase):
+                        if testcase not in facts.templated_tests:
                             for statement in testcase.statements:
                                 self.report_if_not_camel_case(testcase, statement)
                         else:
@@ -148,32 +140,70 @@ class UseCamelCaseKeyword(GeneralRule):
             for statement in keyword.statements:
                 self.report_if_not_camel_case(keyword, statement)
 
-class TrailingWhiteSpaceIgnoreCarriegeReturn(GeneralRule):
+class LineRule:
+    """
+    Mixin for the rules checking the raw text line by line.
+
+    The first line rule applied to a file scans its lines once for all the
+    enabled line rules; each rule then reports what it found when rflint
+    applies it, so the output keeps the usual order.
+    """
+
+    def start(self):
+        """Reset the per-file state before a scan."""
 
-    severity = WARNING
+    def check_line(self, line):
+        """
+        Called with each line of the file in order, after start(). Line rules
+        override it to return the message to report for `line`; returning
+        None reports nothing.
+        """
+        return None
 
     def apply(self, robotfile):
-        linenumber = 0
-        for line in robotfile.raw_text.splitlines():
-            linenumber = linenumber + 1
-            if line.endswith((' ', '\t')):
-                self.report(robotfile, 'Trailing whiteSpace.', linenumber)
+        reports = getattr(robotfile, '_line_reports', {})
+        if self not in reports:
+            rules = [rule for rule in getattr(self.controller, 'general_rules', []) if isinstance(rule, LineRule) and rule.severity != IGNORE]
+            reports = scan_lines(robotfile, rules if self in rules else rules + [self])
+            robotfile._line_reports = reports
+        for message, linenumber in reports.pop(self):
+            self.report(robotfile, message, linenumber)
+
+def scan_lines(robotfile, rules):
+    reports = {rule: [] for rule in rules}
+    for rule in rules:
+        rule.start()
+    for linenumber, line in enumerate(robotfile.raw_text.splitlines(), 1):
+        for rule in rules:
+            message = rule.check_line(line)
+            if message:
+                reports[rule].append((message, linenumber))
+    return reports
+
+class TrailingWhiteSpaceIgnoreCarriegeReturn(LineRule, GeneralRule):
 
-class MoreThanOneBlankLine(GeneralRule):
+    severity = WARNING
+
+    def check_line(self, line):
+        if line.endswith((' ', '\t')):
+            return 'Trailing whiteSpace.'
+
+class MoreThanOneBlankLine(LineRule, GeneralRule):
 
     severity = WARNING
 
-    def apply(self, robotfile):
-        linenumber = 0
-        blank_line = False
-        for line in robotfile.raw_text.splitlines():
-            linenumber = linenumber + 1
-            if line.strip() == '':
-                if blank_line == True:
-                    self.report(robotfile, 'More than one blank line.', linenumber)
-                blank_line = True
-            else:
-                blank_line = False
+    def start(self):
+        self.blank_line = False
+
+    def check_line(self, line):
+        if line.strip() == '':
+            if self.blank_line:
+                return 'More than one blank line.'
+            self.blank_line = True
+        else:
+            self.blank_line = False
+
+instrument(globals())
 
 if __name__ == "__main__":
     import doctest
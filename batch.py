@@ -0,0 +1,47 @@
+"""
+Run the library rules once over a whole project.
+
+    python batch.py [rflint options] FOLDER
+
+MoveKeyword, UnusedKeyword and DuplicatedKeyword are applied to every robot
+file of the project FOLDER belongs to, straight from the project model: no
+file is parsed that the project cache already knows. The reports are
+printed grouped by file, files sorted by path and reports by line, in
+rflint's output format; rflint's --error, --warning, --ignore, --configure,
+--format and --no-filenames options apply. Like rflint, the exit code is
+the number of errors.
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(__file__))
+import rflint.rflint
+from rflint.rflint import RfLint
+import LibraryCheckRule
+from LibraryCheckRule import PROJECT_RULES, lint_project
+from utility import RFProject
+
+# rflint must configure the rules defined above, not a second copy of them
+rflint.rflint.IMPORTED_RULE_FILES.append(os.path.abspath(LibraryCheckRule.__file__))
+
+
+def main(args):
+    linter = RfLint()
+    options = linter.parse_and_process_args(args)
+    if len(options.args) != 1 or not os.path.isdir(options.args[0]):
+        sys.stderr.write('usage: python batch.py [rflint options] FOLDER\n')
+        return 1
+    rules = [rule for rule in linter.general_rules if isinstance(rule, PROJECT_RULES)]
+    project = RFProject(os.path.join(os.path.abspath(options.args[0]), '.project'))
+    errors = 0
+    for path, reports in lint_project(project, rules):
+        if options.print_filenames:
+            print('+ ' + os.path.relpath(path))
+        for linenumber, char, severity, message, rulename in reports:
+            errors += severity == 'E'
+            print(options.format.format(linenumber=linenumber, filename=path, severity=severity,
+                                        message=message, rulename=rulename, char=char))
+    return min(errors, 255)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,419 @@
+"""
+Benchmarks for the rules and the project model.
+
+    python benchmark.py project [options]
+    python benchmark.py duplicated-names [--keywords N]
+    python benchmark.py robustness [--statements N]
+
+`project` generates a synthetic `.project` tree, then times the project
+loading, the parse and the index-only scan of its files and every library,
+style and robustness rule over it, recording wall time and peak memory.
+With --save the results become a JSON baseline; with --baseline they are
+compared against one and any stage slower or bigger than the tolerance
+allows is reported as a regression (exit 1).
+
+`robustness` times the active robustness rules before and after
+CheckedStatement, then the statement classification and the disabled
+missing-waiting check, on one statement-heavy suite.
+
+`duplicated-names` compares the former per-name-length grouping of
+DuplicatedKeyword with group_by_name on synthetic keywords.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import tracemalloc
+sys.path.append(os.path.dirname(__file__))
+from rflint import RobotFactory
+from rflint.common import GeneralRule, SuiteRule, KeywordRule
+from rflint.parser import SuiteFile
+import utility
+from utility import KeywordDef, RFProject
+
+
+WORDS = ['Open', 'Close', 'Click', 'Item', 'Asset', 'Page', 'Dialog', 'Should', 'Be', 'Visible', 'Select', 'Cabinet',
+         'Rack', 'Port', 'Connection', 'Power', 'Create', 'Delete', 'Edit', 'Model', 'Search', 'Result', 'Wait', 'Until']
+
+LIBRARY_CALLS = ['Click Element    id=ok', 'Wait Until Element Is Visible    id=ok    timeout=10s    error=not visible',
+                 'Input Text    id=name    ${value}', 'Log    ${value}', 'Sleep    1s    reason=animation',
+                 'Element Text Should Be    xpath=//div[@class="name"]    ${value}']
+
+ROBUSTNESS_STATEMENTS = LIBRARY_CALLS + ['Unselect Frame', '${text} =    Get Text    xpath=//div[@class="name"]',
+                                         'IF    ${cond}    Sleep    1s    ELSE    Click Element    xpath=//a[text()="ok"]',
+                                         'Run Keyword And Ignore Error    Wait Until Page Contains    ok', 'Action    ${value}']
+
+
+def synthetic_keywords(count, seed=0):
+    rand = random.Random(seed)
+    return [KeywordDef(' '.join(rand.choice(WORDS) for _ in range(rand.randint(2, 6))), 2, 'res%d.txt' % rand.randrange(count // 10 + 1), [])
+            for _ in range(count)]
+
+
+def generate_project(folder, files=200, keywords=20, fanout=3, embedded=0.1, bdd=0.3, run_keywords=0.1, seed=0):
+    """
+    Write a synthetic project of `files` robot files to `folder`: half are
+    resource files defining `keywords` keywords each, half are suites.
+    Each keyword or test calls `fanout` keywords; `embedded` is the share of
+    keywords with an embedded argument, `bdd` and `run_keywords` the share
+    of calls made with a BDD prefix or through `Run Keywords`.
+    """
+    rand = random.Random(seed)
+    os.makedirs(os.path.join(folder, 'resources'), exist_ok=True)
+    os.makedirs(os.path.join(folder, 'suites'), exist_ok=True)
+    open(os.path.join(folder, '.project'), 'w').close()
+
+    resources = max(1, files // 2)
+    names = []
+    for r in range(resources):
+        for k in range(keywords):
+            words = ' '.join(rand.choice(WORDS) for _ in range(rand.randint(2, 4)))
+            if rand.random() < embedded:
+                names.append(('%s ${item} %d %d' % (words, r, k), '%s Rack%d %d %d' % (words, k, r, k)))
+            else:
+                names.append(('%s %d %d' % (words, r, k), None))
+
+    def call(position):
+        name, embedded_call = names[rand.randrange(position)] if position > 0 else (rand.choice(LIBRARY_CALLS), None)
+        name = embedded_call or name
+        if rand.random() < run_keywords:
+            other, other_call = names[rand.randrange(position)] if position > 0 else (rand.choice(LIBRARY_CALLS), None)
+            return 'Run Keywords    %s    AND    %s' % (name, other_call or other)
+        if rand.random() < bdd:
+            return '%s %s' % (rand.choice(['Given', 'When', 'Then', 'And']), name)
+        return name
+
+    position = 0
+    for r in range(resources):
+        with open(os.path.join(folder, 'resources', 'res%04d.robot' % r), 'w') as f:
+            f.write('*** Keywords ***\n')
+            for k in range(keywords):
+                f.write('%s\n' % names[position][0])
+                if names[position][1] != None:
+                    f.write('    ${value} =    Set Variable    ${item}\n')
+                else:
+                    f.write('    [Arguments]    ${value}=default\n')
+                for _ in range(fanout):
+                    f.write('    %s\n' % (call(position) if rand.random() < 0.5 else rand.choice(LIBRARY_CALLS)))
+                f.write('\n')
+                position += 1
+
+    for s in range(files - resources):
+        with open(os.path.join(folder, 'suites', 'suite%04d.robot' % s), 'w') as f:
+            f.write('*** Settings ***\nResource    ../resources/res%04d.robot\nTest Teardown    %s\n\n' % (s % resources, call(len(names))))
+            f.write('*** Test Cases ***\n')
+            for t in range(keywords):
+                f.write('Test %d Of Suite %d\n' % (t, s))
+                for _ in range(fanout):
+                    f.write('    %s\n' % call(len(names)))
+                f.write('\n')
+
+
+class Recorder:
+    """Stands in for the rflint controller and counts the reports."""
+
+    def __init__(self):
+        self.reports = 0
+
+    def report(self, **kwargs):
+        self.reports += 1
+
+
+def rule_classes():
+    import LibraryCheckRule
+    import StyleCheckRule
+    import RobustnessCheckRule
+    modules = [LibraryCheckRule, StyleCheckRule, RobustnessCheckRule]
+    return [cls for module in modules for cls in vars(module).values()
+            if isinstance(cls, type) and issubclass(cls, (GeneralRule, SuiteRule, KeywordRule)) and cls.__module__ == module.__name__]
+
+
+def apply_rule(rule, robot_files):
+    for robot_file in robot_files:
+        if isinstance(rule, GeneralRule):
+            rule.apply(robot_file)
+        elif isinstance(rule, SuiteRule):
+            if isinstance(robot_file, SuiteFile):
+                rule.apply(robot_file)
+        else:
+            for keyword in robot_file.keywords:
+                rule.apply(keyword)
+
+
+def measure(function, repeat=3):
+    """
+    Best wall time of `repeat` plain runs, then the peak traced memory of
+    one more and what its result still holds once it returned.
+    """
+    seconds = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds == None else min(seconds, elapsed)
+    tracemalloc.start()
+    result = function()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {'seconds': round(seconds, 4), 'peak_bytes': peak, 'retained_bytes': retained}
+
+
+def bench_rule(cls, robot_files, repeat=3):
+    recorder = Recorder()
+    result = measure(lambda: apply_rule(cls(recorder), robot_files), repeat)
+    result['reports'] = recorder.reports // (repeat + 1)
+    return result
+
+
+def read_text(path):
+    with open(path, 'rb') as f:
+        return f.read().decode('utf-8')
+
+
+def bench_project(folder, repeat=3):
+    files = utility.all_robot_files(os.path.join(folder, '.project'))
+    anchor = files[0]
+    results = dict()
+    results['discovery'] = measure(lambda: utility.robot_files(folder), repeat)
+    results['project_meta'] = measure(lambda: RFProject(anchor, use_cache=False), repeat)
+    RFProject(anchor)
+    results['project_meta (cached)'] = measure(lambda: RFProject(anchor), repeat)
+    results['parse'] = measure(lambda: [RobotFactory(f) for f in files], repeat)
+    results['scan'] = measure(lambda: [utility.scan_tables(read_text(f)) for f in files], repeat)
+
+    robot_files = [RobotFactory(f) for f in files]
+    utility.projects.add(RFProject(anchor, use_cache=False))
+    for cls in rule_classes():
+        results[cls.__name__] = bench_rule(cls, robot_files, repeat)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for stage, result in results.items():
+        if stage not in baseline:
+            continue
+        for metric in ['seconds', 'peak_bytes', 'retained_bytes']:
+            if metric not in result or metric not in baseline[stage]:
+                continue
+            if result[metric] > baseline[stage][metric] * (1 + tolerance) and result[metric] - baseline[stage][metric] > (0.01 if metric == 'seconds' else 1024):
+                regressions.append('%s %s: %s -> %s' % (stage, metric, baseline[stage][metric], result[metric]))
+    return regressions
+
+
+def statement_heavy_suite(path, statements=20000, per_block=50, seed=0):
+    """A suite of tests and keywords of `per_block` statements each."""
+    rand = random.Random(seed)
+    blocks = max(2, statements // per_block)
+    with open(path, 'w') as f:
+        for table, count in [('Test Cases', blocks // 2), ('Keywords', blocks - blocks // 2)]:
+            f.write('*** %s ***\n' % table)
+            for block in range(count):
+                f.write('%s %d\n' % (table[:-1], block))
+                for _ in range(per_block):
+                    f.write('    %s\n' % rand.choice(ROBUSTNESS_STATEMENTS))
+                f.write('\n')
+
+
+def former_check(rule, obj, statement):
+    """The check the robustness rules ran per statement before CheckedStatement."""
+    import re
+    from RobustnessCheckRule import extract_checked_keyword_calls, WAIT_UNTIL_KEYWORDS
+    wait_until_keywords = sorted(WAIT_UNTIL_KEYWORDS)
+    for keyword, args in extract_checked_keyword_calls(statement):
+        if keyword.lower() == 'unselect frame':
+            rule.report(obj, '`Unselect Frame` -> `[Teardown]    Unselect Frame`', statement.startline)
+        elif keyword.lower() in wait_until_keywords:
+            if not any([token.startswith('timeout') for token in args]):
+                rule.report(obj, 'Missing timeout argument?', statement.startline)
+            if not any([token.startswith('error') for token in args]):
+                rule.report(obj, 'Missing error argument?', statement.startline)
+        elif keyword.lower() == 'sleep' and (len(args) == 0 or "reason=" not in args[-1]):
+            rule.report(obj, 'DO NOT USE SLEEP!', statement.startline)
+
+        xpath = [arg for arg in args if arg.startswith('xpath')]
+        if len(xpath) > 0:
+            if re.search('@class=.*', xpath[0]):
+                rule.report(obj, 'use contains(@class, ...)', statement.startline)
+            if re.search('text()\\s*=', xpath[0]):
+                rule.report(obj, 'use normalize-space(text())=', statement.startline)
+
+
+def former_robustness_rules():
+    """The active robustness rules as they were before CheckedStatement."""
+    import RobustnessCheckRule
+    from rflint.parser import TestcaseTable
+
+    class RobustnessCheck_Test(RobustnessCheckRule.RobustnessCheck_Test):
+
+        def apply(self, suite):
+            if not utility.suite_facts(suite).test_template:
+                for table in suite.tables:
+                    if isinstance(table, TestcaseTable):
+                        for testcase in table.testcases:
+                            for statement in testcase.statements:
+                                former_check(self, testcase, statement)
+
+    class RobustnessCheck_Keyword(RobustnessCheckRule.RobustnessCheck_Keyword):
+
+        def apply(self, keyword):
+            for statement in keyword.statements:
+                former_check(self, keyword, statement)
+
+    return [RobustnessCheck_Test, RobustnessCheck_Keyword]
+
+
+def bench_robustness(statements=20000, repeat=3):
+    import RobustnessCheckRule
+    from RobustnessCheckRule import CheckedStatement, check_missing_waiting
+    folder = tempfile.mkdtemp(prefix='rflint-benchmark-')
+    try:
+        path = os.path.join(folder, 'suite.robot')
+        statement_heavy_suite(path, statements)
+        robot_file = RobotFactory(path)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    blocks = list(robot_file.testcases) + list(robot_file.keywords)
+    rule = RobustnessCheckRule.RobustnessCheck_Keyword(Recorder())
+
+    def classify():
+        # acts_on_element and waits are lazy, read them as check_missing_waiting does
+        classified = [[CheckedStatement(statement) for statement in block.statements] for block in blocks]
+        for checked in classified:
+            for statement in checked:
+                statement.acts_on_element, statement.waits
+        return classified
+
+    classified = classify()
+
+    def missing_waiting():
+        for block, checked in zip(blocks, classified):
+            check_missing_waiting(rule, block, block.name, checked)
+
+    print('robustness checks over %d statements' % sum(len(checked) for checked in classified))
+    print('  %-24s %8s %8s' % ('active rules', 'before', 'after'))
+    for former, cls in zip(former_robustness_rules(), [RobustnessCheckRule.RobustnessCheck_Test, RobustnessCheckRule.RobustnessCheck_Keyword]):
+        before = bench_rule(former, [robot_file], repeat)
+        after = bench_rule(cls, [robot_file], repeat)
+        print('  %-24s %6.3f s %6.3f s  (%d reports)' % (cls.__name__, before['seconds'], after['seconds'], after['reports']))
+    print('  %-24s %15.3f s' % ('classification', measure(classify, repeat)['seconds']))
+    print('  %-24s %15.3f s' % ('check_missing_waiting', measure(missing_waiting, repeat)['seconds']))
+
+
+def group_by_name_length(keywords):
+    """The name grouping DuplicatedKeyword used before group_by_name."""
+    duplicates = dict()
+
+    def compare(same_length):
+        compare_list = []
+        for keyword in same_length + [None]:
+            if keyword != None and len(compare_list) > 0 and keyword.name == compare_list[0].name:
+                compare_list.append(keyword)
+                continue
+            if len(compare_list) > 1:
+                for duplicate in compare_list:
+                    duplicates[duplicate] = [other for other in compare_list if other != duplicate and other.path != duplicate.path]
+            compare_list = [keyword]
+
+    keywords = sorted(keywords, key=lambda x: len(x.name))
+    threads = []
+    for length in range(len(keywords[0].name), len(keywords[-1].name) + 1):
+        same_length = list(filter(lambda keyword: len(keyword.name) == length, keywords))
+        if len(same_length) <= 1:
+            continue
+        threads.append(threading.Thread(target=compare, args=(sorted(same_length, key=lambda x: x.name),)))
+        threads[-1].start()
+    for thread in threads:
+        thread.join()
+    return duplicates
+
+
+def group_by_name(keywords):
+    from LibraryCheckRule import DuplicatedKeyword
+    rule = DuplicatedKeyword(None)
+    rule.all_keywords = keywords
+    rule.group_by_name()
+    return rule.duplicate_names
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_duplicated_names(count=50000):
+    keywords = synthetic_keywords(count)
+    old_time, old = timed(group_by_name_length, keywords)
+    new_time, new = timed(group_by_name, keywords)
+    print('duplicated names over %d keywords' % count)
+    print('  per name length: %8.3f s  (%d duplicated)' % (old_time, len(old)))
+    print('  group_by_name:   %8.3f s  (%d duplicated)' % (new_time, len(new)))
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog='python benchmark.py', description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    project = commands.add_parser('project', help='time project loading and every rule on a synthetic project')
+    project.add_argument('--files', type=int, default=200)
+    project.add_argument('--keywords', type=int, default=20, help='keywords per resource file and tests per suite')
+    project.add_argument('--fanout', type=int, default=3, help='calls per keyword or test')
+    project.add_argument('--embedded', type=float, default=0.1, help='share of keywords with embedded arguments')
+    project.add_argument('--bdd', type=float, default=0.3, help='share of calls with a BDD prefix')
+    project.add_argument('--run-keywords', type=float, default=0.1, help='share of calls made through Run Keywords')
+    project.add_argument('--seed', type=int, default=0)
+    project.add_argument('--repeat', type=int, default=3, help='runs per stage, the fastest is kept')
+    project.add_argument('--folder', help='keep the generated project in FOLDER')
+    project.add_argument('--save', metavar='FILE', help='write the results to FILE as a baseline')
+    project.add_argument('--baseline', metavar='FILE', help='compare the results with the baseline in FILE')
+    project.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown or growth before a regression (default 0.2)')
+    robustness = commands.add_parser('robustness', help='time the robustness checks on a statement-heavy suite')
+    robustness.add_argument('--statements', type=int, default=20000)
+    robustness.add_argument('--repeat', type=int, default=3, help='runs per stage, the fastest is kept')
+    names = commands.add_parser('duplicated-names', help='compare the duplicated name grouping algorithms')
+    names.add_argument('--keywords', type=int, default=50000)
+    args = parser.parse_args(args)
+
+    if args.command == 'robustness':
+        bench_robustness(args.statements, args.repeat)
+        return 0
+    if args.command == 'duplicated-names':
+        bench_duplicated_names(args.keywords)
+        return 0
+
+    parameters = {key: getattr(args, key) for key in ['files', 'keywords', 'fanout', 'embedded', 'bdd', 'run_keywords', 'seed']}
+    folder = args.folder or tempfile.mkdtemp(prefix='rflint-benchmark-')
+    try:
+        generate_project(folder, **parameters)
+        results = bench_project(folder, args.repeat)
+    finally:
+        if not args.folder:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    for stage, result in results.items():
+        print('%-40s %9.3f s %10.1f MB peak %10.1f MB retained %s' % (stage, result['seconds'], result['peak_bytes'] / 1024 / 1024,
+                                                                      result['retained_bytes'] / 1024 / 1024,
+                                                                      '%6d reports' % result['reports'] if 'reports' in result else ''))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'parameters': parameters, 'results': results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['parameters'] != parameters:
+            sys.stderr.write('warning: the baseline was recorded with %s\n' % baseline['parameters'])
+        regressions = compare(results, baseline['results'], args.tolerance)
+        for regression in regressions:
+            print('REGRESSION %s' % regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,67 @@
+"""
+Lint only the files a change since a git revision can affect.
+
+    python changed.py BASE [rflint options] FOLDER
+
+The robot files of the project FOLDER belongs to that differ from the git
+revision BASE (committed, uncommitted or untracked) are linted together
+with the files whose results they can change: the files defining keywords
+they call, the files calling keywords they define and the files sharing a
+duplicated or similar keyword with them. Calls and definitions the files
+had at BASE count too, so removing a call still lints the file whose
+keyword became unused. The whole project is loaded, so the library rules
+give the same results for these files as a full run would.
+"""
+import os
+import sys
+import fnmatch
+import subprocess
+sys.path.append(os.path.dirname(__file__))
+import utility
+from watch import IncrementalLint
+
+
+def git(root, *args):
+    return subprocess.run(['git'] + list(args), cwd=root, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True).stdout
+
+
+def changed_files(root, base):
+    """
+    Robot files of the project in `root` that differ from the git revision
+    `base`, mapped to their content at `base` (None for files added since).
+    """
+    # without renames, the old path of a renamed file shows as deleted and keeps its calls
+    names = git(root, 'diff', '--name-only', '--no-renames', '-z', '--relative', base, '--').split(b'\0')
+    names += git(root, 'ls-files', '--others', '--exclude-standard', '-z').split(b'\0')
+    files = set(utility.project_files(root))
+    include = utility.discovery_globs('RFLINT_INCLUDE', utility.ROBOT_FILES)
+    changed = dict()
+    for name in sorted(set(os.fsdecode(name) for name in names if name != b'')):
+        path = os.path.join(root, name)
+        if path in files or (not os.path.exists(path) and any(fnmatch.fnmatch(os.path.basename(name), glob) for glob in include)):
+            try:
+                changed[path] = git(root, 'show', '%s:./%s' % (base, name))
+            except subprocess.CalledProcessError:
+                changed[path] = None
+    return changed
+
+
+def lint_changed(base, folder, options):
+    linter = IncrementalLint(folder, options)
+    changed = changed_files(linter.project.root, base)
+    previous = [utility.scan_meta(path, data) for path, data in changed.items() if data != None]
+    files = sorted(linter.project.closure(changed, previous))
+    if len(files) == 0:
+        return 0
+    return linter.run(files)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.stderr.write('usage: python changed.py BASE [rflint options] FOLDER\n')
+        sys.exit(1)
+    try:
+        sys.exit(lint_changed(sys.argv[1], sys.argv[-1], sys.argv[2:-1]))
+    except subprocess.CalledProcessError as e:
+        sys.stderr.write('changed.py: %s' % e.stderr.decode(errors='replace'))
+        sys.exit(1)
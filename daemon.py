@@ -0,0 +1,230 @@
+"""
+Keep projects loaded in a daemon and lint files sent to it over a Unix socket.
+
+    python daemon.py serve [rflint options] FOLDER
+    python daemon.py lint FILE...
+    python daemon.py stop FOLDER
+
+`serve` loads the project FOLDER belongs to once, refreshes it as files
+change on disk and lints the files it is sent with the rflint options it
+was started with. `lint` is the thin client: it sends its files to the
+daemon serving their project, prints rflint's output and exits with
+rflint's status, without importing rflint itself. `stop` shuts a daemon
+down.
+
+Each daemon listens on a socket named after its project root, in a folder
+only its user can access: $XDG_RUNTIME_DIR/rflint, or rflint-<uid> in the
+temporary folder. Set RFLINT_SOCKET to choose another path. Clients only
+talk to a socket owned by their own user.
+"""
+import io
+import os
+import sys
+import json
+import stat
+import time
+import socket
+import hashlib
+import tempfile
+import threading
+import traceback
+import contextlib
+import socketserver
+
+ROOT_MARKER = '.project'
+FILE_OPTIONS = ('--rulefile', '-R', '--argumentfile', '-A')
+
+
+def find_root(path):
+    """
+    The closest folder holding a `.project` file, from `path` up; the same
+    as utility.project_root, which the client does not import to start fast.
+    """
+    path = os.path.abspath(path)
+    folder = path if os.path.isdir(path) else os.path.dirname(path)
+    while not os.path.exists(os.path.join(folder, ROOT_MARKER)):
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            raise ValueError('No %s file in %s or its parent folders' % (ROOT_MARKER, path))
+        folder = parent
+    return folder
+
+
+def private_folder(folder):
+    """Raise PermissionError unless `folder` is a real folder owned and only usable by the current user."""
+    status = os.lstat(folder)
+    if not stat.S_ISDIR(status.st_mode) or status.st_uid != os.getuid() or status.st_mode & 0o077:
+        raise PermissionError('%s is not a folder private to the current user' % folder)
+
+
+def socket_path(root, create=False):
+    """
+    Where the daemon serving the project in `root` listens. The socket
+    folder is created when `create` is set; FileNotFoundError is raised
+    when it does not exist, PermissionError when other users could use it.
+    """
+    if os.environ.get('RFLINT_SOCKET'):
+        return os.environ['RFLINT_SOCKET']
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    folder = os.path.join(runtime, 'rflint') if runtime else os.path.join(tempfile.gettempdir(), 'rflint-%d' % os.getuid())
+    if create:
+        os.makedirs(folder, mode=0o700, exist_ok=True)
+    private_folder(folder)
+    return os.path.join(folder, hashlib.sha1(root.encode('utf-8')).hexdigest()[:16] + '.sock')
+
+
+def absolute_options(options):
+    """
+    `options` with the files they name made absolute, since requests run
+    from the client's folder.
+
+    >>> absolute_options(['-R', 'rules.py', '--rulefile=/x/rules.py', '-w', 'MoveKeyword']) == ['-R', os.path.abspath('rules.py'), '--rulefile=/x/rules.py', '-w', 'MoveKeyword']
+    True
+    """
+    result = []
+    for i, option in enumerate(options):
+        if i > 0 and options[i - 1] in FILE_OPTIONS:
+            option = os.path.abspath(option)
+        elif option.startswith(tuple(name + '=' for name in FILE_OPTIONS)):
+            name, value = option.split('=', 1)
+            option = name + '=' + os.path.abspath(value)
+        result.append(option)
+    return result
+
+
+def send(path, request):
+    if os.stat(path).st_uid != os.getuid():
+        raise PermissionError('%s belongs to another user' % path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with client.makefile('rb') as f:
+            return json.loads(f.readline())
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        if request.get('command') == 'lint':
+            response = self.server.linter.lint_request(request)
+        else:
+            response = {'output': '', 'errors': '', 'status': 0}
+            if request.get('command') == 'stop':
+                threading.Thread(target=self.server.shutdown).start()
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+def serve(folder, options, interval=1.0):
+    # rflint is only needed by the daemon, not by the client
+    sys.path.append(os.path.dirname(__file__))
+    from watch import IncrementalLint
+    import utility
+
+    class LintDaemon(IncrementalLint):
+
+        def __init__(self):
+            super().__init__(folder, absolute_options(options))
+            self.lock = threading.Lock()
+
+        def watch(self):
+            while True:
+                time.sleep(interval)
+                try:
+                    with self.lock:
+                        self.project.refresh()
+                except Exception:
+                    # keep watching; the next refresh retries whatever failed
+                    sys.stderr.write('rflint daemon: refresh failed\n' + traceback.format_exc())
+
+        def _sync(self, path):
+            # the file an editor just saved is reloaded at once, other changes on the next refresh
+            if path in self.project.order or path in utility.project_files(self.project.root, refresh=True):
+                self.project.update(path)
+
+        def lint_request(self, request):
+            out, err = io.StringIO(), io.StringIO()
+            with self.lock:
+                cwd = os.getcwd()
+                try:
+                    os.chdir(request['cwd'])
+                    for path in request['files']:
+                        if os.path.isfile(path):
+                            self._sync(os.path.abspath(path))
+                    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+                        status = self.run(request['files'])
+                except Exception:
+                    err.write(traceback.format_exc())
+                    status = 255
+                finally:
+                    os.chdir(cwd)
+            return {'output': out.getvalue(), 'errors': err.getvalue(), 'status': status}
+
+    linter = LintDaemon()
+    try:
+        path = socket_path(linter.project.root, create=True)
+        if os.path.exists(path):
+            try:
+                send(path, {'command': 'ping'})
+            except PermissionError:
+                raise
+            except OSError:
+                os.unlink(path)
+            else:
+                sys.stderr.write('rflint daemon: %s is already served on %s\n' % (linter.project.root, path))
+                return 1
+    except PermissionError as e:
+        sys.stderr.write('rflint daemon: %s\n' % e)
+        return 1
+    umask = os.umask(0o177)
+    try:
+        server = socketserver.UnixStreamServer(path, RequestHandler)
+    finally:
+        os.umask(umask)
+    server.linter = linter
+    threading.Thread(target=linter.watch, daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(path)
+    return 0
+
+
+def lint(files):
+    by_root = dict()
+    for f in files:
+        by_root.setdefault(find_root(f), []).append(f)
+    status = 0
+    for root, files in by_root.items():
+        try:
+            response = send(socket_path(root), {'command': 'lint', 'cwd': os.getcwd(), 'files': files})
+        except PermissionError as e:
+            sys.stderr.write('rflint daemon: %s\n' % e)
+            return 2
+        except OSError:
+            sys.stderr.write('rflint daemon: no daemon serves %s, start one with python daemon.py serve [rflint options] FOLDER\n' % root)
+            return 2
+        sys.stdout.write(response['output'])
+        sys.stderr.write(response['errors'])
+        status = min(status + response['status'], 255)
+    return status
+
+
+def stop(folder):
+    try:
+        send(socket_path(find_root(folder)), {'command': 'stop'})
+    except OSError:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    commands = {'serve': lambda args: serve(args[-1], args[:-1]), 'lint': lint, 'stop': lambda args: stop(args[0])}
+    if len(sys.argv) < 3 or sys.argv[1] not in commands:
+        sys.stderr.write(__doc__.split('\n\n')[1] + '\n')
+        sys.exit(1)
+    try:
+        sys.exit(commands[sys.argv[1]](sys.argv[2:]))
+    except KeyboardInterrupt:
+        pass
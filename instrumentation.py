@@ -0,0 +1,126 @@
+"""
+Opt-in timing and counters for the rules and the project model.
+
+Set RFLINT_PROFILE to a file name to record a run:
+
+    RFLINT_PROFILE=profile.json python -m rflint --rulefile LibraryCheckRule.py FILES
+
+A .json or .csv file receives the wall time of every rule on every file,
+the time spent in each phase of the project model (loading, index
+construction, duplicate detection, ...) and counters such as the files
+parsed or the keyword index lookups, with the names they matched
+literally and through embedded argument patterns. The project is loaded
+by whichever library rule runs first, so that rule's time includes the
+`project loading` phase. A .prof file receives a cProfile dump of the
+whole run instead, for pstats or snakeviz.
+"""
+import os
+import csv
+import json
+import time
+import atexit
+import cProfile
+import functools
+import contextlib
+from rflint.common import Rule
+
+
+class Stats:
+
+    def __init__(self):
+        self.enabled = False
+        self.output = None
+        self.profiler = None
+        self.rules = dict()
+        self.phases = dict()
+        self.counters = dict()
+
+    def enable(self, output):
+        """Record from now on and write the report to `output` at exit."""
+        self.output = output
+        self.pid = os.getpid()
+        if output.endswith('.prof'):
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.enabled = True
+        atexit.register(self.write)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_phase(self, name, seconds):
+        phase = self.phases.setdefault(name, {'seconds': 0.0, 'calls': 0})
+        phase['seconds'] += seconds
+        phase['calls'] += 1
+
+    def add_rule(self, rule, path, seconds):
+        files = self.rules.setdefault(rule, dict())
+        files[path] = files.get(path, 0.0) + seconds
+
+    def report(self):
+        return {'rules': {rule: {'seconds': sum(files.values()), 'files': files} for rule, files in self.rules.items()},
+                'phases': self.phases,
+                'counters': self.counters}
+
+    def write(self):
+        if self.pid != os.getpid():
+            return
+        if self.profiler != None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.output)
+        elif self.output.endswith('.csv'):
+            with open(self.output, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['kind', 'name', 'file', 'seconds', 'count'])
+                for rule, files in self.rules.items():
+                    for path, seconds in files.items():
+                        writer.writerow(['rule', rule, path, '%.6f' % seconds, 1])
+                for name, phase in self.phases.items():
+                    writer.writerow(['phase', name, '', '%.6f' % phase['seconds'], phase['calls']])
+                for name, count in self.counters.items():
+                    writer.writerow(['counter', name, '', '', count])
+        else:
+            with open(self.output, 'w') as f:
+                json.dump(self.report(), f, indent=2)
+
+
+stats = Stats()
+if os.environ.get('RFLINT_PROFILE'):
+    stats.enable(os.environ['RFLINT_PROFILE'])
+
+
+@contextlib.contextmanager
+def recording(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add_phase(name, time.perf_counter() - start)
+
+
+def phase(name):
+    """Context manager timing the `name` phase while recording."""
+    return recording(name) if stats.enabled else contextlib.nullcontext()
+
+
+def timed_apply(apply):
+    @functools.wraps(apply)
+    def timed(rule, obj):
+        start = time.perf_counter()
+        try:
+            return apply(rule, obj)
+        finally:
+            stats.add_rule(rule.name, obj.path, time.perf_counter() - start)
+    timed.instrumented = True
+    return timed
+
+
+def instrument(namespace):
+    """Time `apply` of every rule defined in a rule module's `namespace`, while recording."""
+    if not stats.enabled:
+        return
+    for value in list(namespace.values()):
+        if isinstance(value, type) and issubclass(value, Rule) and value.__module__ == namespace['__name__']:
+            if not getattr(value.apply, 'instrumented', False):
+                value.apply = timed_apply(value.apply)
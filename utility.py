@@ -5,25 +5,264 @@ from pathlib import PureWindowsPath, PurePosixPath
 import os
 import time
 import re
+import hashlib
+import zlib
+import json
+import functools
+import fnmatch
+import bisect
+import threading
+import contextlib
+from collections import OrderedDict
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from instrumentation import stats, phase
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+ROOT_MARKER = '.project'
+ROBOT_FILES = ['*.txt', '*.robot']
+CACHE_FILE = '.rflint_cache.json'
+LOCK_FILE = '.rflint_cache.lock'
+# bump whenever what file_meta() records changes, extract_used_keywords()
+# and the Run Keyword registry included, so stale summaries are not reused
+CACHE_VERSION = 3
+PARALLEL_THRESHOLD = 64
+PROJECT_CACHE_SIZE = 4
+SIGNATURE_BINS = 32
+SIGNATURE_BANDS = 8
+SIGNATURE_MIN_SHINGLES = 8
+
+
+def fingerprint(text):
+    """
+    >>> fingerprint('    Click Element    id=ok')
+    '223b3ba25887bb0a'
+    >>> fingerprint('') == fingerprint('')
+    True
+    """
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def shingles(rows):
+    """
+    Token trigrams of keyword rows, with variables and keyword names
+    normalized so renamed variables or respaced names do not matter.
+
+    >>> sorted(shingles([['', 'Log', '${message}']]))
+    ['\\n\\tlog\\t${}', 'log\\t${}\\t\\n']
+    >>> shingles([['', 'Log', '${a}']]) == shingles([['', 'log', '${b}']])
+    True
+    """
+    tokens = ['\n']
+    for cells in rows:
+        tokens.extend(normalize_name(VARIABLE.sub('${}', cell) if '{' in cell else cell) for cell in cells if cell != '')
+        tokens.append('\n')
+    return set('\t'.join(tokens[i:i + 3]) for i in range(len(tokens) - 2))
+
+
+def signature(shingles):
+    """
+    One-permutation MinHash of a shingle set: every shingle is hashed once
+    into one of SIGNATURE_BINS bins, each bin keeps its minimum, and empty
+    bins borrow from the next non-empty one. Sets too small to compare
+    meaningfully have no signature.
+
+    >>> signature(set('abc'))
+    >>> a = set('%d' % i for i in range(100))
+    >>> similarity(signature(a), signature(a))
+    1.0
+    >>> similarity(signature(a), signature(a | set('%d' % i for i in range(100, 110)))) > 0.7
+    True
+    >>> similarity(signature(a), signature(set('x%d' % i for i in range(100)))) < 0.2
+    True
+    """
+    if len(shingles) < SIGNATURE_MIN_SHINGLES:
+        return None
+    bins = [None] * SIGNATURE_BINS
+    for shingle in shingles:
+        value = zlib.crc32(shingle.encode('utf-8'))
+        i = value % SIGNATURE_BINS
+        value = value // SIGNATURE_BINS
+        if bins[i] == None or value < bins[i]:
+            bins[i] = value
+    ret = list(bins)
+    following = None
+    for i in range(2 * SIGNATURE_BINS - 1, -1, -1):
+        if bins[i % SIGNATURE_BINS] != None:
+            following = i
+        elif i < SIGNATURE_BINS:
+            ret[i] = bins[following % SIGNATURE_BINS] + ((following - i) << 32)
+    return ret
+
+
+def similarity(signature, other):
+    return sum(1 for a, b in zip(signature, other) if a == b) / SIGNATURE_BINS
+
+
+def signature_bands(signature):
+    width = SIGNATURE_BINS // SIGNATURE_BANDS
+    return [(band, tuple(signature[band * width:(band + 1) * width])) for band in range(SIGNATURE_BANDS)]
+
+
+paths = []
+path_ids = dict()
+def file_id(path):
+    """
+    A small integer standing for `path`, so records store the path once.
+    Ids are only valid in the process that made them; records pickle the
+    path itself.
+
+    >>> file_id('/project/res.txt') == file_id('/project/res.txt')
+    True
+    >>> file_path(file_id('/project/res.txt'))
+    '/project/res.txt'
+    """
+    if path not in path_ids:
+        path_ids[path] = len(paths)
+        paths.append(path)
+    return path_ids[path]
+
+
+def file_path(id):
+    return paths[id]
+
+
+class KeywordDef:
+    """
+    A keyword definition reduced to what the project-wide rules need:
+    its name, where it is, a fingerprint of each non-blank row and a
+    MinHash signature of its body for near-duplicate detection.
+    """
+    __slots__ = ('name', 'linenumber', 'file', 'rows', 'signature')
+
+    def __init__(self, name, linenumber, path, rows, signature=None):
+        self.name = name
+        self.linenumber = linenumber
+        self.file = file_id(path)
+        self.rows = rows
+        self.signature = array('Q', signature) if signature != None else None
+
+    @property
+    def path(self):
+        return paths[self.file]
+
+    def __reduce__(self):
+        return (KeywordDef, (self.name, self.linenumber, self.path, self.rows, self.signature))
+
+    def __repr__(self):
+        return '<KeywordDef: %s>' % self.name
 
 
 class RFMeta:
+    """
+    What the library rules need from one file: the line of each keyword it
+    defines (`defs`), the lines calling each keyword it uses (`uses`, as
+    array('I')), its KeywordDefs and whether it holds test cases.
+    """
+    __slots__ = ('file', 'defs', 'uses', 'keywords', 'is_test_data', '_modified')
 
     def __init__(self, source):
-        self.source = source
-        self.modified = time.ctime(os.path.getmtime(source))
+        self.file = file_id(source)
         self.defs = dict()
         self.uses = dict()
+        self.keywords = []
         self.is_test_data = False
+        self._modified = None
+
+    @property
+    def source(self):
+        return paths[self.file]
+
+    @property
+    def modified(self):
+        if self._modified == None:
+            self._modified = time.ctime(os.path.getmtime(self.source))
+        return self._modified
+
+    def add_def(self, name, line):
+        if name not in self.defs:
+            self.defs[name] = line
+
+    def add_use(self, name, line):
+        lines = self.uses.get(name)
+        if lines == None:
+            lines = self.uses[name] = array('I')
+        lines.append(line)
+
+    def to_cache(self):
+        return {'defs': dict(self.defs),
+                'uses': {name: lines.tolist() for name, lines in self.uses.items()},
+                'keywords': [[keyword.name, keyword.linenumber, keyword.rows, keyword.signature.tolist() if keyword.signature != None else None] for keyword in self.keywords],
+                'is_test_data': self.is_test_data}
+
+    @classmethod
+    def from_cache(cls, source, entry):
+        rfmeta = cls(source)
+        rfmeta.defs = dict(entry['defs'])
+        rfmeta.uses = {name: array('I', lines) for name, lines in entry['uses'].items()}
+        rfmeta.keywords = [KeywordDef(name, line, source, rows, signature) for name, line, rows, signature in entry['keywords']]
+        rfmeta.is_test_data = entry['is_test_data']
+        return rfmeta
+
+    def __reduce__(self):
+        return (RFMeta.from_cache, (self.source, self.to_cache()))
 
     def __str__(self):
         return ('source: %s\n' % self.source) +\
                ('  modified: %s\n' % self.modified) +\
                ('  defs: %s\n' % str(self.defs)) + \
-               ('  uses: %s\n' % str(self.uses))
+               ('  uses: %s\n' % str({name: lines.tolist() for name, lines in self.uses.items()}))
 
 
-def extract_name(tokens):
+class SuiteFacts:
+    """
+    What the style and robustness rules ask about a parsed file, worked
+    out in one pass over its setting and test case tables.
+    """
+
+    def __init__(self, robotfile):
+        self.settings = dict()
+        self.teardowns = []
+        self.templated_tests = set()
+        for table in robotfile.tables:
+            if isinstance(table, SettingTable):
+                for row in table.rows:
+                    self.settings.setdefault(row[0].lower(), []).append(row)
+                    if row[0].lower().endswith('teardown'):
+                        self.teardowns.append(row)
+            elif isinstance(table, TestcaseTable):
+                for testcase in table.testcases:
+                    if any(len(statement) > 1 and statement[1].lower() == '[template]' for statement in testcase.statements):
+                        self.templated_tests.add(testcase)
+        self.test_template = 'test template' in self.settings
+
+
+def suite_facts(robotfile):
+    """The SuiteFacts of `robotfile`, shared by every rule applied to it."""
+    facts = getattr(robotfile, '_suite_facts', None)
+    if facts == None:
+        facts = robotfile._suite_facts = SuiteFacts(robotfile)
+    return facts
+
+NOT_CALLING = frozenset(['[Documentation]', '[Arguments]', '[Tags]', '[Return]', '[Timeout]', ':FOR'])
+NAME_PREFIXES = frozenset(['', '\\', '...', '[Setup]', '[Teardown]', '[Template]'])
+CALL_PREFIXES = frozenset(['\\', '', '[teardown]', '[template]', '[setup]', 'given', 'when', 'then', 'and'])
+BDD_PREFIXES = ('given ', 'when ', 'then ', 'and ')
+BRANCHES = frozenset(['else if', 'else'])
+ASSIGNMENT = re.compile(r'[@$&]\{[^\}]+\}')
+
+
+def extract_name(tokens, start=0):
     """
     No keyword
     >>> extract_name([''])
@@ -47,6 +286,8 @@ def extract_name(tokens):
     'Open Application'
     >>> extract_name(['', '[Template]', 'Example keyword'])
     'Example keyword'
+    >>> extract_name(['Suite Setup', 'Open Application', 'App B'], 1)
+    'Open Application'
 
     assign
     >>> extract_name(['', '${x}', 'Get X'])
@@ -64,19 +305,26 @@ def extract_name(tokens):
     >>> extract_name(['Then She Is Happy'])
     'She Is Happy'
     """
-    if len(tokens) == 0 or tokens[0].startswith('#') or tokens[0] in ['[Documentation]', '[Arguments]', '[Tags]', '[Return]', '[Timeout]', ':FOR']:
-        return None
-    if tokens[0] in ['', '\\', '...', '[Setup]', '[Teardown]', '[Template]']:
-        return extract_name(tokens[1:])
-    if re.match(r'[@$&]\{[^\}]+\}.*', tokens[0]):
-        return extract_name(tokens[1:])
-    for bdd_token in ['given ', 'when ', 'then ', 'and ']:
-        if tokens[0].lower().startswith(bdd_token):
-            return tokens[0][len(bdd_token):].strip()
-    return tokens[0]
+    return _extract_name(tokens, start, len(tokens))
+
 
+def _extract_name(tokens, start, end):
+    while start < end:
+        token = tokens[start]
+        if token.startswith('#') or token in NOT_CALLING:
+            return None
+        if token in NAME_PREFIXES or ASSIGNMENT.match(token):
+            start += 1
+            continue
+        lower = token.lower()
+        for bdd_token in BDD_PREFIXES:
+            if lower.startswith(bdd_token):
+                return token[len(bdd_token):].strip()
+        return token
+    return None
 
-def extract_used_keywords(tokens):
+
+def extract_used_keywords(tokens, start=0):
     """
     >>> extract_used_keywords([''])
     []
@@ -140,6 +388,8 @@ def extract_used_keywords(tokens):
     ['Action B']
     >>> extract_used_keywords(['', '[Timeout]', '1 min'])
     []
+    >>> extract_used_keywords(['Test Setup', 'Action A'], 1)
+    ['Action A']
 
     run keywords
     >>> extract_used_keywords(['Run Keywords', 'Action A', 'Action B', 'Action C'])
@@ -170,122 +420,990 @@ def extract_used_keywords(tokens):
     []
     """
     ret = []
-    if len(tokens) == 0 or tokens[0].startswith('#') or tokens[0] in ['[Documentation]', '[Arguments]', '[Tags]', '[Return]', '[Timeout]', ':FOR']:
-        return ret
-    if tokens[0].lower() in ['\\', '', '[teardown]', '[template]', '[setup]', 'given', 'when', 'then', 'and'] or re.match(r'[@$&]\{[^\}]+\}.*', tokens[0].lower()):
-        return extract_used_keywords(tokens[1:])
-    if tokens[0].lower() == 'if':
-        indexes = [2] + [i for i, v in enumerate(tokens) if v.lower() in ['else if', 'else']]
-        for i in range(len(indexes)-1):
-            ret.extend(extract_used_keywords(tokens[indexes[i]:indexes[i+1]]))
-        ret.extend(extract_used_keywords(tokens[indexes[-1]:]))
-        return ret
-    if tokens[0].lower() == 'for':
-        return ret
-    if tokens[0].lower() == 'end':
-        return ret
-    if tokens[:2] == ['...', 'ELSE'] or tokens[:2] == ['...', 'AND']:
-        return extract_used_keywords(tokens[2:])
-    if tokens[:2] == ['...', 'ELSE IF']:
-        return extract_used_keywords(tokens[3:])
-    if tokens[0] == 'ELSE':
-        return extract_used_keywords(tokens[1:])
-    if tokens[0] == 'ELSE IF':
-        return extract_used_keywords(tokens[2:])
-    if tokens[0] == '...':
-        return extract_used_keywords(tokens[1:])
-    name = extract_name(tokens)
-    if name:
-        ret.append(name)
-    if tokens[0].lower() in ['run keyword', 'run keyword and continue on failure', 'run keyword and ignore error',
-                             'run keyword and return', 'run keyword and return status', 'run keyword if all critical tests passed',
-                             'run keyword if all tests passed', 'run keyword if any critical tests failed', 'run keyword if any tests failed',
-                             'run keyword if test failed', 'run keyword if test passed', 'run keyword if timeout occurred', 'run setup only once', 'run teardown only once']:
-        ret.extend(extract_used_keywords(tokens[1:]))
-    elif tokens[0].lower() in ['run keyword and return if', 'run keyword and expect error', 'run keyword if',
-                               'run keyword unless', 'keyword should succeed within a period']:
-        indexes = [2] + [i for i, v in enumerate(tokens) if v.lower() in ['else if', 'else']]
-        for i in range(len(indexes)-1):
-            ret.extend(extract_used_keywords(tokens[indexes[i]:indexes[i+1]]))
-        ret.extend(extract_used_keywords(tokens[indexes[-1]:]))
-    elif tokens[0].lower() in ['wait until keyword succeeds']:
-        ret.extend(extract_used_keywords(tokens[3:]))
-    elif tokens[0].lower() in ['run keywords']:
-        if 'AND' in tokens:
-            itokens = [i for i, v in enumerate(tokens) if v.lower() in ['run keywords', 'and']]
-            for i in range(len(itokens)-1):
-                ret.extend(extract_used_keywords(tokens[itokens[i]+1:itokens[i+1]]))
-            ret.extend(extract_used_keywords(tokens[itokens[-1]+1:]))
-        else:
-            ret.extend(tokens[1:])
+    ranges = [(start, len(tokens))]
+    while ranges:
+        start, end = ranges.pop()
+        children = []
+        while start < end:
+            token = tokens[start]
+            if token.startswith('#') or token in NOT_CALLING:
+                break
+            lower = token.lower()
+            if lower in CALL_PREFIXES or ASSIGNMENT.match(token):
+                start += 1
+                continue
+            if lower == 'if':
+                children = nested_calls(tokens, start, end)
+                break
+            if lower == 'for' or lower == 'end':
+                break
+            if token == '...':
+                following = tokens[start+1] if start + 1 < end else None
+                start += 3 if following == 'ELSE IF' else 2 if following in ('ELSE', 'AND') else 1
+                continue
+            if token == 'ELSE' or token == 'ELSE IF':
+                start += 1 if token == 'ELSE' else 2
+                continue
+
+            name = _extract_name(tokens, start, end)
+            if name:
+                ret.append(name)
+            children = nested_calls(tokens, start, end) or []
+            break
+        ranges.extend(reversed(children))
     return [e for e in ret if not (e.startswith("${") and e.endswith("}"))]
 
 
-def is_root_folder(path):
+def normalize_name(string):
+    return string.replace(" ", "").replace("_", "").lower()
+
+
+# How the keywords run by other keywords are laid out in their arguments:
+# NESTED_CALL - the keyword and its arguments start `offset` tokens after the runner
+# NESTED_BRANCHES - like NESTED_CALL, with more calls after each ELSE / ELSE IF <condition>
+# NESTED_SEQUENCE - calls separated by AND, or one keyword per token without any AND
+# The inline IF is no keyword but lays its branches out like Run Keyword If.
+NESTED_CALL = 'call'
+NESTED_BRANCHES = 'branches'
+NESTED_SEQUENCE = 'sequence'
+RUN_KEYWORD_VARIANTS = {normalize_name(name): layout for name, layout in [
+    ('Run Keyword', (NESTED_CALL, 1)),
+    ('Run Keyword And Continue On Failure', (NESTED_CALL, 1)),
+    ('Run Keyword And Ignore Error', (NESTED_CALL, 1)),
+    ('Run Keyword And Return', (NESTED_CALL, 1)),
+    ('Run Keyword And Return Status', (NESTED_CALL, 1)),
+    ('Run Keyword And Warn On Failure', (NESTED_CALL, 1)),
+    ('Run Keyword If All Critical Tests Passed', (NESTED_CALL, 1)),
+    ('Run Keyword If All Tests Passed', (NESTED_CALL, 1)),
+    ('Run Keyword If Any Critical Tests Failed', (NESTED_CALL, 1)),
+    ('Run Keyword If Any Tests Failed', (NESTED_CALL, 1)),
+    ('Run Keyword If Test Failed', (NESTED_CALL, 1)),
+    ('Run Keyword If Test Passed', (NESTED_CALL, 1)),
+    ('Run Keyword If Timeout Occurred', (NESTED_CALL, 1)),
+    ('Run Setup Only Once', (NESTED_CALL, 1)),
+    ('Run Teardown Only Once', (NESTED_CALL, 1)),
+    ('Run Keyword And Expect Error', (NESTED_CALL, 2)),
+    ('Run Keyword And Return If', (NESTED_CALL, 2)),
+    ('Run Keyword Unless', (NESTED_CALL, 2)),
+    ('Repeat Keyword', (NESTED_CALL, 2)),
+    ('Keyword Should Succeed Within A Period', (NESTED_CALL, 2)),
+    ('Wait Until Keyword Succeeds', (NESTED_CALL, 3)),
+    ('Run Keyword If', (NESTED_BRANCHES, 2)),
+    ('IF', (NESTED_BRANCHES, 2)),
+    ('Run Keywords', (NESTED_SEQUENCE, 1)),
+]}
+
+
+def nested_calls(tokens, start=0, end=None):
+    """
+    The (start, end) ranges of the keyword calls made by the one at
+    `start`, or None when it does not run other keywords.
+
+    >>> nested_calls(['Click Element', 'id=ok'])
+    >>> nested_calls(['Run Keyword And Warn On Failure', 'Action A', 'arg'])
+    [(1, 3)]
+    >>> nested_calls(['', 'Wait Until Keyword Succeeds', '1min', '1s', 'Action A'], 1)
+    [(4, 5)]
+    >>> nested_calls(['run_keyword_if', '${a}', 'Action A', 'ELSE IF', '${b}', 'Action B', 'ELSE', 'Action C', 'arg'])
+    [(2, 3), (5, 6), (7, 9)]
+    >>> nested_calls(['IF', '${a}', 'Action A', 'END'])
+    [(2, 3)]
+    >>> nested_calls(['Run Keywords', 'Action A', 'arg', 'AND', 'Action B'])
+    [(1, 3), (4, 5)]
+    >>> nested_calls(['Run Keywords', 'Action A', 'Action B'])
+    [(1, 2), (2, 3)]
+    """
+    end = len(tokens) if end == None else end
+    layout = RUN_KEYWORD_VARIANTS.get(normalize_name(tokens[start]))
+    if layout == None:
+        return None
+    kind, offset = layout
+    begin = start + offset
+    if kind == NESTED_CALL:
+        return [(begin, end)]
+    ranges = []
+    if kind == NESTED_SEQUENCE:
+        if not any(tokens[i] == 'AND' for i in range(begin, end)):
+            return [(i, i+1) for i in range(begin, end)]
+        for i in range(begin, end):
+            if tokens[i] == 'AND':
+                ranges.append((begin, i))
+                begin = i + 1
+    else:
+        for i in range(begin, end):
+            lower = tokens[i].lower()
+            if lower == 'end':
+                end = i
+                break
+            if lower in BRANCHES:
+                ranges.append((begin, i))
+                begin = i + (2 if lower == 'else if' else 1)
+    ranges.append((begin, end))
+    return ranges
+
+
+def same(keyword_def, keyword_use):
+    """
+    >>> same('Get Position', 'Get Position 1')
+    False
+    >>> same('Get Position', 'Get Position')
+    True
+    >>> same('Use Variable ${var1}', 'Use Variable 123')
+    True
+    >>> same('Use Variable 123', 'Use Variable ${var1}')
+    True
+    >>> same('Use Variable ${var1}', 'Use Variable ${var2}')
+    True
+    >>> same('Use Variable ${var1} hi', 'Use Variable 132')
+    False
+    >>> same('The Column ${customField} Was Set To Be Visible', 'The Column ${customField.fieldName} Was Set To Be Visible')
+    True
+    >>> same('The Column ${customField.fieldName} Was Set To Be Visible', 'The Column ${customField} Was Set To Be Visible')
+    True
+    >>> same('Action', '"*+,-./:;<="()')
+    False
+    >>> same('Action', '(')
+    False
+    >>> same('.', '.')
+    True
+    >>> same('Action', None)
+    False
+    """
     try:
-        if not os.path.isdir(path):
+        if keyword_def != keyword_use and (keyword_def == None or keyword_use == None):
             return False
-        if '.project' in [f.encode('cp950').decode() for f in os.listdir(path)]:
-            return True
+        ndef = normalize_name(keyword_def)
+        nuse = normalize_name(keyword_use)
+        if ('{' in ndef and '}' in ndef) or ('{' in nuse and '}' in nuse):
+            return embedded_pattern(ndef).match(nuse) != None or embedded_pattern(nuse).match(ndef) != None
+        return ndef == nuse
     except:
-        if '.project' in [f.encode('utf-8').decode() for f in os.listdir(path)]:
-            return True
+        raise Exception((keyword_def, keyword_use))
+
+
+EMBEDDED_ARGUMENT = re.compile(r'\\?[@$&]\\{[^\}]+\\}')
+VARIABLE = re.compile(r'[@$&]\{[^\}]+\}')
+
+
+@functools.lru_cache(maxsize=None)
+def embedded_pattern(normalized):
+    return re.compile("^%s$" % EMBEDDED_ARGUMENT.sub(r'.+', re.escape(normalized)))
+
+
+class KeywordIndex:
+    """
+    Finds the names `same()` matches without comparing against all of them.
+
+    Literal names are looked up by their normalized form. Names with
+    embedded arguments are compiled once and bucketed by the literal text
+    before their first argument, so a lookup only tries the patterns whose
+    prefix the looked up name starts with.
+
+    >>> index = KeywordIndex(['Get Position', 'Use Variable ${var1}', 'Open ${app} Application'])
+    >>> index.lookup('get_position')
+    ['Get Position']
+    >>> index.lookup('Use Variable 123')
+    ['Use Variable ${var1}']
+    >>> index.lookup('Open ${name} Application')
+    ['Open ${app} Application']
+    >>> index.lookup('Get ${what}')
+    ['Get Position']
+    >>> index.lookup('Use Variable')
+    []
+    >>> index.lookup(None)
+    []
+    >>> index.remove('Use Variable ${var1}')
+    >>> index.lookup('Use Variable 123')
+    []
+    """
+
+    def __init__(self, names=()):
+        self.literals = dict()
+        self.patterns = dict()
+        self.prefixes = []
+        self.sorted = None
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        normalized = normalize_name(name)
+        if name in self.literals.setdefault(normalized, []):
+            return
+        self.literals[normalized].append(name)
+        self.sorted = None
+        variable = VARIABLE.search(normalized)
+        if variable:
+            prefix = normalized[:variable.start()]
+            if prefix not in self.patterns:
+                self.patterns[prefix] = []
+                self.prefixes = sorted(set(len(p) for p in self.patterns))
+            self.patterns[prefix].append((embedded_pattern(normalized), name))
+
+    def remove(self, name):
+        normalized = normalize_name(name)
+        if name not in self.literals.get(normalized, []):
+            return
+        self.literals[normalized].remove(name)
+        if len(self.literals[normalized]) == 0:
+            del self.literals[normalized]
+        self.sorted = None
+        variable = VARIABLE.search(normalized)
+        if variable:
+            prefix = normalized[:variable.start()]
+            self.patterns[prefix] = [(pattern, candidate) for pattern, candidate in self.patterns[prefix] if candidate != name]
+            if len(self.patterns[prefix]) == 0:
+                del self.patterns[prefix]
+                self.prefixes = sorted(set(len(p) for p in self.patterns))
+
+    def lookup(self, name):
+        if stats.enabled:
+            stats.count('index lookups')
+        if name == None:
+            return []
+        normalized = normalize_name(name)
+        ret = list(self.literals.get(normalized, []))
+        literal_hits = len(ret)
+        for length in self.prefixes:
+            for pattern, candidate in self.patterns.get(normalized[:length], []):
+                if candidate not in ret and pattern.match(normalized):
+                    ret.append(candidate)
+        variable = VARIABLE.search(normalized)
+        if variable:
+            if self.sorted == None:
+                self.sorted = sorted(self.literals)
+            pattern = embedded_pattern(normalized)
+            prefix = normalized[:variable.start()]
+            for i in range(bisect.bisect_left(self.sorted, prefix), len(self.sorted)):
+                if not self.sorted[i].startswith(prefix):
+                    break
+                if pattern.match(self.sorted[i]):
+                    ret.extend(candidate for candidate in self.literals[self.sorted[i]] if candidate not in ret)
+        if stats.enabled:
+            stats.count('index literal hits', literal_hits)
+            stats.count('index pattern hits', len(ret) - literal_hits)
+        return ret
+
+
+def is_root_folder(path):
+    return os.path.exists(os.path.join(path, ROOT_MARKER))
 
 
 def project_file(path):
-    return os.path.join(project_root(path), '.project')
+    return os.path.join(project_root(path), ROOT_MARKER)
 
 
+project_roots = dict()
 def project_root(path):
-    if is_root_folder(path):
-        return path
-    if platform.system() == "Linux":
-        return project_root(PurePosixPath(path).parent)
-    else:
-        return project_root(PureWindowsPath(path).parent)
+    """
+    The closest folder holding a `.project` file, from `path` up. Every
+    folder looked at on the way is memoized, so each is checked only once.
+    """
+    path = str(path)
+    visited = []
+    while path not in project_roots:
+        visited.append(path)
+        if is_root_folder(path):
+            project_roots[path] = path
+            break
+        parent = os.path.dirname(path)
+        if parent == path:
+            raise ValueError('No %s file in %s or its parent folders' % (ROOT_MARKER, visited[0]))
+        path = parent
+    for folder in visited:
+        project_roots[folder] = project_roots[path]
+    return project_roots[path]
+
+
+def discovery_globs(variable, default):
+    value = os.environ.get(variable)
+    return default if value == None else [glob for glob in value.split(',') if glob != '']
+
+
+def matches(name, relative, globs):
+    return any(fnmatch.fnmatch(name, glob) or fnmatch.fnmatch(relative, glob) for glob in globs)
+
+
+def robot_files(folder, include=None, exclude=None):
+    """
+    The files under `folder` matching an `include` glob, in os.walk order,
+    without the files and folders matching an `exclude` glob. Globs are
+    matched against the name and the path relative to `folder`; they
+    default to the comma-separated RFLINT_INCLUDE and RFLINT_EXCLUDE, or to
+    `*.txt,*.robot` and nothing.
+    """
+    include = discovery_globs('RFLINT_INCLUDE', ROBOT_FILES) if include == None else include
+    exclude = discovery_globs('RFLINT_EXCLUDE', []) if exclude == None else exclude
+    files = []
+    pending = [(str(folder), '')]
+    while pending:
+        path, relative = pending.pop()
+        folders = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    name = os.path.join(relative, entry.name)
+                    if matches(entry.name, name, exclude):
+                        continue
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            folders.append((entry.path, name))
+                    elif matches(entry.name, name, include):
+                        files.append(entry.path)
+        except OSError:
+            continue
+        pending.extend(reversed(folders))
+    return files
 
 
 def all_robot_files(path):
-    ret = []
+    return robot_files(parent_folder(path))
+
+
+project_file_lists = dict()
+def project_files(root, refresh=False):
+    """The robot files of the project in `root`, listed once per run unless refreshed."""
+    if refresh or root not in project_file_lists:
+        project_file_lists[root] = robot_files(root)
+    return project_file_lists[root]
+
+
+def parent_folder(path):
     if platform.system() == "Linux":
-        p = PurePosixPath(path)
+        return PurePosixPath(path).parent
     else:
-        p = PureWindowsPath(path)
-    for root, _, files in os.walk(p.parents[0]):
-        for f in files:
-            if f.endswith('.txt') or f.endswith('.robot'):
-                ret.append(os.path.join(root, f))
-    return ret
+        return PureWindowsPath(path).parent
 
 
-def project_meta(path):
-    ret = []
-    if platform.system() == "Linux":
-        parrentFile = PurePosixPath(path).parent
+def is_comment_or_documentation(cells):
+    """
+    >>> is_comment_or_documentation(['', '# TODO'])
+    True
+    >>> is_comment_or_documentation(['', '[Documentation]', 'Opens the page'])
+    True
+    >>> is_comment_or_documentation(['', 'Log', '# not a comment'])
+    False
+    """
+    for cell in cells:
+        if cell != '':
+            return cell.startswith('#') or cell.lower() == '[documentation]'
+    return False
+
+
+SETTING_USES = frozenset(['test setup', 'test teardown', 'suite setup', 'suite teardown', 'test template'])
+
+
+def add_keyword(rfmeta, name, linenumber, rows):
+    """Record the keyword `name` defined at `linenumber`, `rows` being its (linenumber, raw_text, cells)."""
+    rfmeta.add_def(name, linenumber)
+    body = [cells for line, text, cells in rows if not (text == '' or is_comment_or_documentation(cells))]
+    rfmeta.keywords.append(KeywordDef(name, linenumber, rfmeta.source, [fingerprint(text) for line, text, cells in rows if text != ''], signature(shingles(body))))
+    for line, text, cells in rows:
+        for used_keyword in extract_used_keywords(cells):
+            rfmeta.add_use(used_keyword, line)
+
+
+def setting_statements(table):
+    try:
+        return table.statements
+    except IndexError:
+        # rflint fails on a setting table holding nothing but blank rows
+        return []
+
+
+def file_meta(rfile, rf):
+    rfmeta = RFMeta(rfile)
+    for keyword in rf.walk(Keyword):
+        add_keyword(rfmeta, keyword.name, keyword.linenumber, [(row.linenumber, row.raw_text, row.cells) for row in keyword.rows])
+    for table in rf.tables:
+        if isinstance(table, SettingTable):
+            for statement in setting_statements(table):
+                if statement[0].lower() in SETTING_USES:
+                    for used_keyword in extract_used_keywords(statement, 1):
+                        rfmeta.add_use(used_keyword, statement.startline)
+        elif isinstance(table, TestcaseTable):
+            rfmeta.is_test_data = True
+            for testcase in table.testcases:
+                for statement in testcase.statements:
+                    for used_keyword in extract_used_keywords(statement):
+                        rfmeta.add_use(used_keyword, statement.startline)
+    return rfmeta
+
+
+TABLE_HEADING = re.compile(r'^\s*\*+\s*(.*?)[ *]*$', re.IGNORECASE)
+TABLE_KINDS = [('settings', re.compile(r'settings?|metadata', re.IGNORECASE)),
+               ('variables', re.compile(r'variables?', re.IGNORECASE)),
+               ('testcases', re.compile(r'test ?cases?', re.IGNORECASE)),
+               ('keywords', re.compile(r'(user )?keywords?', re.IGNORECASE))]
+INDEXED_TABLES = frozenset(['settings', 'testcases', 'keywords'])
+SPACE_SEPARATOR = re.compile('[ \t\xa0]{2,}|\t+')
+PIPE_SEPARATOR = re.compile('[ \t\xa0]+\\|(?=[ \t\xa0]+)')
+PIPE_STARTS = frozenset(['|', '| ', '|\t', '|\xa0'])
+PIPE_ENDS = frozenset([' |', '\t|', '\xa0|'])
+
+
+def split_row(row):
+    """
+    The cells of a row, split the way rflint splits them.
+
+    >>> split_row('    Click Element    id=ok')
+    ['', 'Click Element', 'id=ok']
+    >>> split_row('| | Click Element | id=ok |')
+    ['', 'Click Element', 'id=ok']
+    >>> split_row('Action\tLog  1')
+    ['Action', 'Log', '1']
+    """
+    if row[:2] in PIPE_STARTS:
+        row = row[1:-1] if row[-2:] in PIPE_ENDS else row[1:]
+        return [cell.strip() for cell in PIPE_SEPARATOR.split(row)]
+    return SPACE_SEPARATOR.split(row)
+
+
+def table_kind(name):
+    """
+    >>> table_kind('Test Cases'), table_kind('Keyword'), table_kind('Tasks')
+    ('testcases', 'keywords', None)
+    """
+    for kind, pattern in TABLE_KINDS:
+        if pattern.match(name):
+            return kind
+    return None
+
+
+def scan_tables(text):
+    """
+    (kind, rows) of the setting, test case and keyword tables in `text`,
+    rows being (linenumber, raw_text, cells). Only the rows of these tables
+    are split into cells.
+    """
+    lines = text.replace('\xa0', ' ').split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    tables = []
+    rows = None
+    for linenumber, line in enumerate(lines, 1):
+        line = line.rstrip()
+        cells = None
+        if '*' in line:
+            cells = split_row(line)
+            heading = TABLE_HEADING.match(cells[0])
+            if heading:
+                kind = table_kind(heading.group(1))
+                rows = [] if kind in INDEXED_TABLES else None
+                if rows != None:
+                    tables.append((kind, rows))
+                continue
+        if rows != None:
+            rows.append((linenumber, line, cells if cells != None else split_row(line)))
+    return tables
+
+
+def table_children(rows):
+    """(name, linenumber, rows) of the keywords or test cases of a table, grouped like rflint does."""
+    children = []
+    for linenumber, text, cells in rows:
+        if cells[0] != '' and not cells[0].lstrip().startswith('#'):
+            children.append((cells[0], linenumber, []))
+            if len(cells) > 1:
+                children[-1][2].append((linenumber, text, [''] + cells[1:]))
+        elif len(children) > 0:
+            children[-1][2].append((linenumber, text, cells))
+    return children
+
+
+def joined_statements(rows, continuation):
+    """(startline, cells) of the statements made of `rows`, a row starting with `continuation` continuing the previous one."""
+    statements = []
+    for linenumber, text, cells in rows:
+        if len(statements) > 0 and cells[:len(continuation)] == continuation:
+            statements[-1][1].extend(cells[len(continuation):])
+        else:
+            statements.append((linenumber, list(cells)))
+    return statements
+
+
+def scan_meta(rfile, data):
+    """
+    RFMeta of `rfile` read from its raw `data` without building rflint's
+    parse tree: the same RFMeta as file_meta(rfile, RobotFactory(rfile)).
+
+    >>> meta = scan_meta('res.robot', b'*** Settings ***\\nSuite Setup    Open\\n*** Keywords ***\\nOpen\\n    Log    1\\n')
+    >>> meta.defs, {name: list(lines) for name, lines in meta.uses.items()}, meta.is_test_data
+    ({'Open': 4}, {'Log': [5], 'Open': [2]}, False)
+    """
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError:
+        return file_meta(rfile, RobotFactory(rfile))
+    if text.startswith('\ufeff'):
+        text = text[1:]
+    tables = scan_tables(text)
+    rfmeta = RFMeta(rfile)
+    for kind, rows in tables:
+        if kind == 'keywords':
+            for name, linenumber, body in table_children(rows):
+                add_keyword(rfmeta, name, linenumber, body)
+    for kind, rows in tables:
+        if kind == 'settings':
+            for startline, statement in joined_statements(rows, ['...']):
+                if statement[0].lower() in SETTING_USES:
+                    for used_keyword in extract_used_keywords(statement, 1):
+                        rfmeta.add_use(used_keyword, startline)
+        elif kind == 'testcases':
+            rfmeta.is_test_data = True
+            for name, linenumber, body in table_children(rows):
+                for startline, statement in joined_statements(body, ['', '...']):
+                    for used_keyword in extract_used_keywords(statement):
+                        rfmeta.add_use(used_keyword, startline)
+    return rfmeta
+
+
+def load_cache(root):
+    try:
+        with open(os.path.join(root, CACHE_FILE), encoding='utf-8') as f:
+            cache = json.load(f)
+        if cache.get('version') == CACHE_VERSION:
+            return cache['files']
+    except (OSError, ValueError, KeyError):
+        pass
+    return dict()
+
+
+def save_cache(root, files):
+    path = os.path.join(root, CACHE_FILE)
+    temporary = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+    try:
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'files': files}, f)
+        os.replace(temporary, path)
+    except OSError:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+@contextlib.contextmanager
+def project_lock(root):
+    """
+    Hold the lock file of the project in `root`. The lock is released when
+    the process ends, however it ends; a project folder where the lock
+    file cannot be created is used without locking.
+    """
+    try:
+        f = open(os.path.join(root, LOCK_FILE), 'a+')
+    except OSError:
+        yield
+        return
+    with f:
+        if fcntl != None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl != None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def load_file(rfile, entry, rf=None):
+    """
+    RFMeta of `rfile`, reused from its cache `entry` while the file is
+    unchanged. A changed file is summarized from `rf` when rflint already
+    parsed it, and scanned with scan_meta() otherwise. Returns (rfmeta,
+    entry, whether the entry changed).
+    """
+    stat = os.stat(rfile)
+    if entry != None and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+        return RFMeta.from_cache(rfile, entry), entry, False
+    with open(rfile, 'rb') as f:
+        data = f.read()
+    digest = content_hash(data)
+    if entry == None or entry['hash'] != digest:
+        rfmeta = file_meta(rfile, rf) if rf != None else scan_meta(rfile, data)
+        entry = rfmeta.to_cache()
     else:
-        parrentFile = PureWindowsPath(path).parent
-    for rfile in all_robot_files(project_file(parrentFile)):
-        rf = RobotFactory(rfile)
-        rfmeta = RFMeta(rfile)
-        for keyword in rf.walk(Keyword):
-            rfmeta.defs.setdefault(keyword.name, {'line': keyword.linenumber, 'file': rfile})
-            for row in keyword.rows:
-                for used_keyword in extract_used_keywords(row.cells):
-                    rfmeta.uses.setdefault(used_keyword, []).append({'line': row.linenumber, 'file': rfile})
-        for table in rf.tables:
-            if isinstance(table, SettingTable):
-                for statement in table.statements:
-                    if statement[0].lower() in ['test setup', 'test teardown', 'suite setup', 'suite teardown', 'test template']:
-                        for used_keyword in extract_used_keywords(statement[1:]):
-                            rfmeta.uses.setdefault(used_keyword, []).append({'line': statement.startline, 'file': rfile})
-            elif isinstance(table, TestcaseTable):
-                rfmeta.is_test_data = True
-                for testcase in table.testcases:
-                    for statement in testcase.statements:
-                        for used_keyword in extract_used_keywords(statement):
-                            rfmeta.uses.setdefault(used_keyword, []).append({'line': statement.startline, 'file': rfile})
-        ret.append(rfmeta)
-    return ret
+        rfmeta = RFMeta.from_cache(rfile, entry)
+    entry.update(mtime=stat.st_mtime, size=stat.st_size, hash=digest)
+    return rfmeta, entry, True
+
+
+def stamp(entry):
+    """What tells whether a cache entry is still up to date."""
+    return {'mtime': entry['mtime'], 'size': entry['size'], 'hash': entry['hash']}
+
+
+def load_files(files, entries, workers=None):
+    """
+    Yield load_file() of every file in order, as soon as it is loaded.
+
+    Only the RFMeta summaries leave this function: each parse tree is
+    dropped once its file is summarized, so memory grows with the
+    summaries rather than with the parse trees of the whole project.
+
+    Files are spread over a process pool; `workers` defaults to
+    RFLINT_WORKERS or the number of CPUs. Fewer than PARALLEL_THRESHOLD
+    files to parse, or a single worker, load serially.
+    """
+    if workers == None:
+        workers = int(os.environ.get('RFLINT_WORKERS', '0')) or os.cpu_count() or 1
+    stale = sum(1 for rfile, entry in zip(files, entries) if entry == None or entry['mtime'] != os.stat(rfile).st_mtime)
+    done = 0
+    if workers > 1 and stale >= PARALLEL_THRESHOLD:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for result in pool.map(load_file, files, entries, chunksize=max(1, len(files) // (workers * 4))):
+                    yield result
+                    done += 1
+            return
+        except (OSError, BrokenProcessPool):
+            pass
+    for rfile, entry in zip(files[done:], entries[done:]):
+        yield load_file(rfile, entry)
+
+
+class RFProject:
+    """
+    Every robot file of a project, parsed at most once per run.
+
+    `metas` holds the RFMeta of each file and `keywords` maps each file to
+    its KeywordDefs. Files rflint has already parsed can be passed in
+    `parsed` (path -> robot file) so they are not read a second time.
+
+    The metas are kept in `CACHE_FILE` next to `.project`; a file is only
+    parsed again when its mtime or size changed and its content hash no
+    longer matches the cached one. Set RFLINT_CACHE=0 to bypass the cache.
+    When the cache is out of date, concurrent processes take turns through
+    `LOCK_FILE`: the first one parses and publishes the changed files, and
+    the others then load them from the cache instead of parsing them again.
+
+    A long-running process keeps the project up to date with `update()` or
+    `refresh()`; each change bumps `generation` so rules know to recompute
+    whatever they derived from the previous state.
+    """
+
+    def __init__(self, path, parsed=None, use_cache=None, workers=None):
+        parsed = parsed or dict()
+        if use_cache == None:
+            use_cache = os.environ.get('RFLINT_CACHE', '1') != '0'
+        self.root = str(project_root(parent_folder(path)))
+        self.use_cache = use_cache
+        self.generation = 0
+        self.metas = []
+        self.keywords = dict()
+        self.entries = dict()
+        with phase('project loading'):
+            files = project_files(self.root)
+            cache = load_cache(self.root) if use_cache else dict()
+            loaded = False
+            if use_cache and not self._up_to_date(cache, files):
+                # one process at a time brings the cache up to date; the
+                # processes waiting for it then find the files it published
+                with project_lock(self.root):
+                    cache = load_cache(self.root)
+                    if not self._up_to_date(cache, files):
+                        self._load_all(files, cache, parsed, workers)
+                        loaded = True
+            if not loaded:
+                self._load_all(files, cache, parsed, workers)
+        self._build_usage_graph()
+
+    def _up_to_date(self, cache, files):
+        """Whether `cache` holds an entry matching each of `files` on disk, and nothing else."""
+        if len(cache) != len(files):
+            return False
+        for rfile in files:
+            entry = cache.get(self._key(rfile))
+            if entry == None:
+                return False
+            stat = os.stat(rfile)
+            if entry['mtime'] != stat.st_mtime or entry['size'] != stat.st_size:
+                return False
+        return True
+
+    def _load_all(self, files, cache, parsed, workers):
+        pending = [rfile for rfile in files if rfile not in parsed]
+        loaded = load_files(pending, [cache.get(self._key(rfile)) for rfile in pending], workers)
+        cached = len(cache)
+        dirty = False
+        for rfile in files:
+            previous = cache.pop(self._key(rfile), None)
+            rfmeta, entry, changed = load_file(rfile, previous, parsed[rfile]) if rfile in parsed else next(loaded)
+            if stats.enabled:
+                stats.count('files loaded')
+                stats.count('files parsed' if previous == None or previous['hash'] != entry['hash'] else 'files reused from cache')
+            dirty = dirty or changed
+            self.entries[self._key(rfile)] = stamp(entry)
+            self.keywords[rfile] = rfmeta.keywords
+            self.metas.append(rfmeta)
+        if dirty or len(self.entries) != cached:
+            self.save()
+
+    def _key(self, rfile):
+        return os.path.relpath(rfile, self.root)
+
+    def _entry(self, rfile):
+        """The cache entry of `rfile`, rebuilt from its RFMeta and stamp."""
+        if self._key(rfile) not in self.entries or rfile not in self.order:
+            return None
+        return dict(self.metas[self.order[rfile]].to_cache(), **self.entries[self._key(rfile)])
+
+    def _load(self, rfile, rf=None):
+        rfmeta, entry, changed = load_file(rfile, self._entry(rfile), rf)
+        self.entries[self._key(rfile)] = stamp(entry)
+        return rfmeta, changed
+
+    def save(self):
+        if self.use_cache:
+            save_cache(self.root, {self._key(meta.source): dict(meta.to_cache(), **self.entries[self._key(meta.source)]) for meta in self.metas})
+
+    def _build_usage_graph(self):
+        self.order = {meta.source: i for i, meta in enumerate(self.metas)}
+        self.users = dict()
+        self.definers = dict()
+        for meta in self.metas:
+            for name in meta.uses:
+                self.users.setdefault(name, []).append(meta)
+            for name in meta.defs:
+                self.definers.setdefault(name, []).append(meta)
+        with phase('keyword index construction'):
+            self.use_index = KeywordIndex(self.users)
+            self.def_index = KeywordIndex(self.definers)
+        with phase('caller resolution'):
+            self.callers = {name: self._find_callers(name) for name in self.definers}
+
+    def _find_callers(self, keyword):
+        found = dict()
+        for name in self.use_index.lookup(keyword):
+            for meta in self.users[name]:
+                found[meta.source] = meta
+        return sorted(found.values(), key=lambda meta: self.order[meta.source])
+
+    def meta_of(self, path):
+        """The RFMeta of the project file `path`, None for a file outside the project."""
+        return self.metas[self.order[path]] if path in self.order else None
+
+    def callers_of(self, keyword):
+        """RFMetas of the files calling `keyword`, in project order."""
+        if keyword in self.callers:
+            return self.callers[keyword]
+        return self._find_callers(keyword)
+
+    def call_sites(self, keyword):
+        """Every (file, line) where `keyword` is called."""
+        return [(meta.source, line) for name in self.use_index.lookup(keyword) for meta in self.users[name] for line in meta.uses[name]]
+
+    def _unlink(self, meta):
+        for names, index, attribute in [(self.users, self.use_index, 'uses'), (self.definers, self.def_index, 'defs')]:
+            for name in getattr(meta, attribute):
+                names[name].remove(meta)
+                if len(names[name]) == 0:
+                    del names[name]
+                    index.remove(name)
+
+    def _link(self, meta):
+        for names, index, attribute in [(self.users, self.use_index, 'uses'), (self.definers, self.def_index, 'defs')]:
+            for name in getattr(meta, attribute):
+                if name not in names:
+                    index.add(name)
+                names.setdefault(name, []).append(meta)
+
+    def _update(self, path, rf=None):
+        old = self.meta_of(path)
+        new = None
+        if os.path.isfile(path):
+            new, changed = self._load(path, rf)
+            if old != None and not changed:
+                return set()
+        elif old == None:
+            return set()
+        else:
+            del self.entries[self._key(path)]
+
+        if old != None:
+            self._unlink(old)
+            del self.keywords[path]
+            if new != None:
+                self.metas[self.order[path]] = new
+            else:
+                self.metas.remove(old)
+        else:
+            self.metas.append(new)
+        if new != None:
+            self._link(new)
+            self.keywords[path] = new.keywords
+        self.order = {meta.source: i for i, meta in enumerate(self.metas)}
+
+        changed = [meta for meta in (old, new) if meta != None]
+        names = set(name for meta in changed for name in meta.defs)
+        for used in set(name for meta in changed for name in meta.uses):
+            names.update(self.def_index.lookup(used))
+        affected = {path}
+        for name in names:
+            if name in self.definers:
+                self.callers[name] = self._find_callers(name)
+                affected.update(meta.source for meta in self.definers[name])
+            else:
+                self.callers.pop(name, None)
+
+        affected |= self._duplicates_of([keyword for meta in changed for keyword in meta.keywords])
+        self.generation += 1
+        return affected
+
+    def _duplicates_of(self, keywords):
+        """Files defining a keyword sharing its name, implementation or a similarity band with one of `keywords`."""
+        duplicate_names = set(normalize_name(keyword.name) for keyword in keywords)
+        duplicate_rows = set(tuple(keyword.rows) for keyword in keywords)
+        similar_bands = set(band for keyword in keywords if keyword.signature != None for band in signature_bands(keyword.signature))
+        found = set()
+        for source, defined in self.keywords.items():
+            if any(normalize_name(keyword.name) in duplicate_names or tuple(keyword.rows) in duplicate_rows for keyword in defined):
+                found.add(source)
+            elif any(keyword.signature != None and not similar_bands.isdisjoint(signature_bands(keyword.signature)) for keyword in defined):
+                found.add(source)
+        return found
+
+    def closure(self, files, previous=()):
+        """
+        The project files whose lint results a change to `files` can affect:
+        the changed files, the files defining keywords they call, the files
+        calling keywords they define and the files sharing a duplicated or
+        similar keyword with them. `previous` are RFMetas of the changed
+        files before the change, whose calls and definitions count too.
+        """
+        affected = set(path for path in files if path in self.order)
+        metas = [self.meta_of(path) for path in affected] + list(previous)
+        for meta in metas:
+            for name in meta.uses:
+                for defined in self.def_index.lookup(name):
+                    affected.update(definer.source for definer in self.definers[defined])
+            for name in meta.defs:
+                affected.update(caller.source for caller in self.callers_of(name))
+        return affected | self._duplicates_of([keyword for meta in metas for keyword in meta.keywords])
+
+    def update(self, path, rf=None):
+        """
+        Reload one changed, added or deleted file and patch the usage graph.
+
+        Returns the files whose library rule results may have changed. The
+        patched project lints like one built from scratch, and so does one
+        loaded from the cache it saved:
+
+        >>> import shutil, tempfile
+        >>> from LibraryCheckRule import PROJECT_RULES, lint_project
+        >>> lint = lambda project: lint_project(project, [rule(None, 'W') for rule in PROJECT_RULES])
+        >>> folder = shutil.copytree(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'LibraryCheckRule', 'move_keyword', 'case1'), os.path.join(tempfile.mkdtemp(), 'case1'))
+        >>> project = RFProject(os.path.join(folder, '.project'))
+        >>> rules = [rule(None, 'W') for rule in PROJECT_RULES]
+        >>> _ = lint_project(project, rules)
+        >>> suite = os.path.join(folder, 'testsuite2.txt')
+        >>> with open(suite, 'w') as f:
+        ...     _ = f.write('*** Test Case ***\\nTest\\n    Action 2\\n')
+        >>> sorted(os.path.basename(path) for path in project.update(suite))
+        ['keywords.txt', 'testsuite2.txt']
+        >>> project.update(suite)
+        set()
+        >>> os.remove(os.path.join(folder, 'testsuite1.txt'))
+        >>> sorted(os.path.basename(path) for path in project.refresh())
+        ['keywords.txt', 'testsuite1.txt']
+        >>> cold = lint(RFProject(os.path.join(folder, '.project'), use_cache=False))
+        >>> lint_project(project, rules) == lint(RFProject(os.path.join(folder, '.project'))) == cold
+        True
+        >>> [(os.path.basename(path), report[0], report[3]) for path, reports in cold for report in reports]
+        [('keywords.txt', 2, 'Unused Keyword'), ('keywords.txt', 5, 'Move the keyword to file `testsuite2.txt`')]
+        >>> shutil.rmtree(os.path.dirname(folder))
+        """
+        affected = self._update(path, rf)
+        if affected:
+            self.save()
+        return affected
+
+    def refresh(self):
+        """Reload every file changed on disk; returns the affected files."""
+        files = project_files(self.root, refresh=True)
+        affected = set()
+        for rfile in set(self.order) - set(files):
+            affected |= self._update(rfile)
+        for rfile in files:
+            entry = self.entries.get(self._key(rfile))
+            try:
+                stat = os.stat(rfile)
+            except FileNotFoundError:
+                # deleted since the files were listed
+                affected |= self._update(rfile)
+                continue
+            if entry == None or entry['mtime'] != stat.st_mtime or entry['size'] != stat.st_size:
+                affected |= self._update(rfile)
+        if affected:
+            self.save()
+        return affected
+
+
+class ProjectCache:
+    """
+    The RFProjects of the project roots used most recently, at most `size`
+    of them (RFLINT_PROJECTS, by default PROJECT_CACHE_SIZE). A project is
+    built once even when several threads ask for it at the same time, and
+    building one root does not hold up the lookups of the others.
+    """
+
+    def __init__(self, size=None):
+        if size == None:
+            size = int(os.environ.get('RFLINT_PROJECTS', PROJECT_CACHE_SIZE))
+        self.size = max(1, size)
+        self.projects = OrderedDict()
+        self.building = dict()
+        self.lock = threading.Lock()
+
+    def _cached(self, root):
+        project = self.projects.get(root)
+        if project != None:
+            self.projects.move_to_end(root)
+        return project
+
+    def add(self, project):
+        """Cache `project` as the most recently used one, evicting the least recently used beyond `size`."""
+        with self.lock:
+            self.projects[project.root] = project
+            self.projects.move_to_end(project.root)
+            while len(self.projects) > self.size:
+                self.projects.popitem(last=False)
+
+    def get(self, rf_file):
+        """The project `rf_file` belongs to, built from its root the first time one of its files is linted."""
+        root = str(project_root(parent_folder(rf_file.path)))
+        with self.lock:
+            project = self._cached(root)
+            if project != None:
+                return project
+            building = self.building.setdefault(root, threading.Lock())
+        with building:
+            with self.lock:
+                project = self._cached(root)
+            if project == None:
+                try:
+                    project = RFProject(rf_file.path, {rf_file.path: rf_file})
+                    self.add(project)
+                finally:
+                    with self.lock:
+                        self.building.pop(root, None)
+        return project
+
+
+projects = ProjectCache()
+def get_project(rf_file):
+    return projects.get(rf_file)
+
+
+def project_meta(path):
+    return RFProject(path).metas
 
 
 if __name__ == "__main__":
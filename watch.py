@@ -0,0 +1,61 @@
+"""
+Keep a project loaded and re-lint only the files a change can affect.
+
+    python watch.py [rflint options] FOLDER
+
+Every robot file of the project FOLDER belongs to is linted once. The
+project is then polled for changes and, after each change, only the files
+whose results can differ are linted again: the changed file, the files
+defining keywords it calls or used to call, and the files sharing a
+duplicated name or implementation with it.
+"""
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(__file__))
+from rflint.rflint import RfLint
+import utility
+
+
+class IncrementalLint:
+
+    def __init__(self, folder, options):
+        self.options = options
+        self.rflint = RfLint()
+        self.project = utility.RFProject(os.path.join(os.path.abspath(folder), '.project'))
+
+    def run(self, files):
+        """Lint `files` with rflint; returns its exit status."""
+        # the rules must see this project, even if linting other roots evicted it
+        utility.projects.add(self.project)
+        return self.rflint.run(self.options + files)
+
+    def lint(self, files):
+        files = sorted(f for f in files if os.path.isfile(f))
+        if len(files) > 0:
+            self.run(files)
+        return files
+
+    def lint_all(self):
+        return self.lint(meta.source for meta in self.project.metas)
+
+    def lint_changes(self):
+        return self.lint(self.project.refresh())
+
+
+def watch(folder, options, interval=1.0):
+    linter = IncrementalLint(folder, options)
+    linter.lint_all()
+    while True:
+        time.sleep(interval)
+        linter.lint_changes()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.stderr.write('usage: python watch.py [rflint options] FOLDER\n')
+        sys.exit(1)
+    try:
+        watch(sys.argv[-1], sys.argv[1:-1])
+    except KeyboardInterrupt:
+        pass